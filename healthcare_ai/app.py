@@ -1,17 +1,35 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify, g, Response, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from collections import Counter
-from datetime import datetime
-import pandas as pd, joblib, re, os, json
+from datetime import datetime, date, timedelta
+import re, os, json, cProfile, threading, ipaddress
+import click
+from dataset_store import DatasetStore
+from model_registry import ModelRegistry, LiveModel
+from result_cache import ResultCache
+from directory import ReferenceDirectory, DoctorCard
+from history_writer import HistoryWriter
+from metrics import Metrics
+import history_export
+from sqlalchemy import event, select, inspect, text, bindparam
+from sqlalchemy.dialects import sqlite, postgresql, mysql
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+# Files shipped with the app resolve against its directory, not the working directory.
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 app = Flask(__name__)
 app.config.update(
-    SQLALCHEMY_DATABASE_URI='sqlite:///'+os.path.join(os.path.abspath(os.path.dirname(__file__)),'symptom_tracker.db'),
+    SQLALCHEMY_DATABASE_URI=os.environ.get("DATABASE_URL",'sqlite:///'+os.path.join(BASE_DIR,'symptom_tracker.db')),
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
     SECRET_KEY=os.environ.get("SECRET_KEY","sympto-care-secret-key"))
 db = SQLAlchemy(app)
+metrics = Metrics()
 
 # ── Models ───────────────────────────────────────────────────────────────
 class User(db.Model):
@@ -32,7 +50,9 @@ class SearchHistory(db.Model):
     top_prediction = db.Column(db.String(200))
     confidence     = db.Column(db.Float)
     alternatives   = db.Column(db.Text)
+    resolved       = db.Column(db.Text)         # JSON list of the symptom columns the query resolved to
     timestamp      = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    __table_args__ = (db.Index('ix_search_history_user_ts','user_id','timestamp','id'),)
     def confidence_pct(self): return f"{self.confidence*100:.1f}%" if self.confidence else "N/A"
 
 class Doctor(db.Model):
@@ -43,6 +63,13 @@ class Doctor(db.Model):
     hospital  = db.Column(db.String(150))
     available = db.Column(db.Boolean, default=True)
 
+# One row, bumped in the same transaction as any change to `doctors`; every worker polls it
+# to notice roster changes made elsewhere (see ReferenceDirectory).
+class DirectoryVersion(db.Model):
+    __tablename__ = 'directory_version'
+    id      = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
     id        = db.Column(db.Integer, primary_key=True)
@@ -51,10 +78,30 @@ class Appointment(db.Model):
     disease   = db.Column(db.String(200))
     appt_date = db.Column(db.String(20))
     appt_time = db.Column(db.String(10))
+    slot_start= db.Column(db.DateTime)        # NULL only on legacy rows whose slot was unreadable or double-booked
     booked_at = db.Column(db.DateTime, default=datetime.utcnow)
     doctor    = db.relationship('Doctor', backref='appointments')
+    # The unique (doctor, slot) index both rejects double bookings and serves availability range scans.
+    __table_args__ = (db.Index('ix_appointments_user_booked','user_id','booked_at','id'),
+                      db.Index('ux_appointments_doctor_slot','doctor_id','slot_start',unique=True))
     user      = db.relationship('User', backref='appointments')
 
+# Daily rollups of search_history (UTC days), upserted in the same transaction as the rows they
+# count; `flask --app app rebuild-rollups` recounts them from scratch.
+class PredictionDaily(db.Model):
+    __tablename__ = 'rollup_prediction_daily'
+    KEY = 'top_prediction'
+    day            = db.Column(db.Date, primary_key=True)
+    top_prediction = db.Column(db.String(200), primary_key=True)
+    searches       = db.Column(db.Integer, nullable=False, default=0)
+
+class SymptomDaily(db.Model):
+    __tablename__ = 'rollup_symptom_daily'
+    KEY = 'symptom'
+    day      = db.Column(db.Date, primary_key=True)
+    symptom  = db.Column(db.String(200), primary_key=True)
+    searches = db.Column(db.Integer, nullable=False, default=0)
+
 # ── Disease → Specialty ──────────────────────────────────────────────────
 DS = {
     "Fungal infection":"Dermatologist","Acne":"Dermatologist","Psoriasis":"Dermatologist",
@@ -151,13 +198,79 @@ REMEDIES = {
 }
 GENERIC = ["Consult a healthcare professional","Rest","Stay hydrated","Monitor symptoms closely"]
 
+# ── Appointment slots ────────────────────────────────────────────────────
+# Bookable start times (clinic local time), with a lunch break after noon.
+SLOT_TIMES = tuple(datetime.strptime(t,"%H:%M").time() for t in (
+    "09:00","09:30","10:00","10:30","11:00","11:30","12:00",
+    "13:00","13:30","14:00","14:30","15:00","15:30","16:00","16:30","17:00"))
+AVAILABILITY_MAX_DAYS = 31
+
+def parse_slot(day, clock):
+    """datetime for a form's date ('2026-10-17') and time ('09:30 AM' or '09:30'); None unless it is a listed slot."""
+    try: d=datetime.strptime(day.strip(),"%Y-%m-%d").date()
+    except ValueError: return None
+    for fmt in ("%I:%M %p","%H:%M"):
+        try: t=datetime.strptime(clock.strip(),fmt).time(); break
+        except ValueError: continue
+    else: return None
+    return datetime.combine(d,t) if t in SLOT_TIMES else None
+
+def slot_label(t): return t.strftime("%I:%M %p")
+
 # ── Init DB ──────────────────────────────────────────────────────────────
+# WAL lets /history reads proceed while a history batch is being written.
+SQLITE_PRAGMAS = ("journal_mode=WAL","synchronous=NORMAL","busy_timeout=5000","temp_store=MEMORY","cache_size=-16000")
+
+def _sqlite_pragmas(dbapi_conn, _):
+    cur=dbapi_conn.cursor()
+    for p in SQLITE_PRAGMAS: cur.execute(f"PRAGMA {p}")
+    cur.close()
+
 with app.app_context():
-    db.create_all()
-    if not Doctor.query.count():
-        db.session.bulk_save_objects([Doctor(name=n,specialty=s,hospital=h) for n,s,h in DOCTORS_SEED])
+    if db.engine.dialect.name=="sqlite": event.listen(db.engine,"connect",_sqlite_pragmas)
+    metrics.instrument_engine(db.engine)
+
+def _add_column(model, name, conn):
+    """ALTER TABLE ... ADD COLUMN for a model column missing from an older database; True if added."""
+    t=model.__table__
+    if name in {c["name"] for c in inspect(conn).get_columns(t.name)}: return False
+    conn.execute(text(f"ALTER TABLE {t.name} ADD COLUMN {name} {t.c[name].type.compile(dialect=conn.dialect)}"))
+    return True
+
+def _migrate_appointment_slots():
+    """Add appointments.slot_start to databases created before it and backfill it from the text columns.
+
+    A slot booked more than once keeps only its earliest appointment, so the unique index can be built;
+    the later duplicates stay visible with a NULL slot_start.
+    """
+    t=Appointment.__table__
+    with db.engine.begin() as conn:
+        if not _add_column(Appointment,"slot_start",conn): return
+        taken,updates=set(),[]
+        for appt_id,doctor_id,d,tm in conn.execute(select(t.c.id,t.c.doctor_id,t.c.appt_date,t.c.appt_time).order_by(t.c.id)):
+            slot=parse_slot(d or "",tm or "")
+            if slot and (doctor_id,slot) not in taken:
+                taken.add((doctor_id,slot)); updates.append(dict(appt_id=appt_id,slot=slot))
+        if updates: conn.execute(t.update().where(t.c.id==bindparam("appt_id")).values(slot_start=bindparam("slot")),updates)
+
+def init_db():
+    """Create tables and indexes and seed the doctors; run once via `flask --app app init-db`."""
+    with app.app_context():
+        db.create_all()
+        _migrate_appointment_slots()
+        with db.engine.begin() as conn: _add_column(SearchHistory,"resolved",conn)   # filled by rebuild-rollups
+        for m in (SearchHistory,Appointment):           # create_all skips indexes on tables that already exist
+            for ix in m.__table__.indexes: ix.create(db.engine,checkfirst=True)
+        if db.session.get(DirectoryVersion,1) is None: db.session.add(DirectoryVersion(id=1,version=0))
+        if not Doctor.query.count():
+            db.session.bulk_save_objects([Doctor(name=n,specialty=s,hospital=h) for n,s,h in DOCTORS_SEED])
         db.session.commit()
 
+@app.cli.command("init-db")
+def init_db_command():
+    """Create the database schema and seed reference data."""
+    init_db(); click.echo(f"Initialised {db.engine.url.render_as_string(hide_password=True)}")
+
 # ── Helpers ──────────────────────────────────────────────────────────────
 def login_required(f):
     @wraps(f)
@@ -166,34 +279,308 @@ def login_required(f):
         return f(*a,**kw)
     return wrap
 
-def get_remedies(name):
-    if name in REMEDIES: return REMEDIES[name]
-    for k,v in REMEDIES.items():
-        if k.lower() in name.lower() or name.lower() in k.lower(): return v
-    return GENERIC
-
-def get_doctors(disease):
-    spec = DS.get(disease) or next((v for k,v in DS.items() if k.lower() in disease.lower()),None) or "General Physician"
-    docs = Doctor.query.filter_by(specialty=spec,available=True).limit(2).all()
-    return (docs or Doctor.query.filter_by(specialty="General Physician").limit(2).all()), spec
-
-symptom_columns = []
-try: model=joblib.load("disease_model.pkl"); symptom_columns=list(model.feature_names_in_)
-except: pass
-
-def load_df():
-    for f in ("sample_dataset.csv","data.csv","dataset.csv"):
-        try:
-            df=pd.read_csv(f)
-            if any(c.lower().replace(" ","_") in [s.lower() for s in symptom_columns] for c in df.columns): return df
-        except: pass
-    return pd.DataFrame()
-
-def to_int(v):
-    try: return int(v)
-    except:
-        try: return int(float(v))
-        except: return 1 if str(v).strip().lower() in ("1","true","yes","y") else 0
+def api_login_required(f):
+    @wraps(f)
+    def wrap(*a,**kw):
+        if 'user_id' not in session: return jsonify(error="Authentication required."),401
+        return f(*a,**kw)
+    return wrap
+
+# Admins are listed by username in SYMPTOCARE_ADMINS (comma-separated).
+ADMINS = {u.strip() for u in os.environ.get("SYMPTOCARE_ADMINS","").split(",") if u.strip()}
+
+def is_admin(): return session.get("username") in ADMINS
+
+def admin_required(f):
+    @wraps(f)
+    def wrap(*a,**kw):
+        if 'user_id' not in session: return jsonify(error="Authentication required."),401
+        if not is_admin(): return jsonify(error="Admins only."),403
+        return f(*a,**kw)
+    return wrap
+
+# Monitoring endpoints answer admins, and clients (a Prometheus scraper) from MONITORING_ALLOW:
+# comma-separated addresses or networks as seen in request.remote_addr.
+MONITORING_ALLOW = [ipaddress.ip_network(n.strip(),strict=False)
+                    for n in os.environ.get("MONITORING_ALLOW","").split(",") if n.strip()]
+
+def monitoring_required(f):
+    guarded=admin_required(f)
+    @wraps(f)
+    def wrap(*a,**kw):
+        try: addr=ipaddress.ip_address(request.remote_addr or "")
+        except ValueError: addr=None
+        if addr is not None and any(addr in n for n in MONITORING_ALLOW): return f(*a,**kw)
+        return guarded(*a,**kw)
+    return wrap
+
+# ── Metrics & profiling ──────────────────────────────────────────────────
+# With METRICS_DIR set (gunicorn.conf.py does), every worker shares its series there and /metrics
+# reports the sum over all workers instead of only the one that answered.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+# An admin adding ?profile=1 to any request gets it run under cProfile; the .prof file
+# (snakeviz / flameprof / pstats) lands in PROFILE_DIR and its path in the X-Profile header.
+PROFILE_DIR = os.environ.get("PROFILE_DIR",os.path.join(BASE_DIR,"profiles"))
+_profile_lock = threading.Lock()            # cProfile allows one active profiler per process
+
+@app.before_request
+def _start_request():
+    g.metrics_t0=metrics.start_request()
+    if request.args.get("profile")=="1" and is_admin() and _profile_lock.acquire(blocking=False):
+        g.profiler=cProfile.Profile()
+        try: g.profiler.enable()
+        except ValueError: g.pop("profiler"); _profile_lock.release()   # another profiling tool is active
+
+def _stop_profiler():
+    prof=g.pop("profiler",None)
+    if prof: prof.disable(); _profile_lock.release()
+    return prof
+
+@app.after_request
+def _finish_request(resp):
+    prof=_stop_profiler()
+    if prof:
+        os.makedirs(PROFILE_DIR,exist_ok=True)
+        path=os.path.join(PROFILE_DIR,f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{request.endpoint}.prof")
+        prof.dump_stats(path); resp.headers["X-Profile"]=path
+    metrics.end_request(g.pop("metrics_t0"),request.endpoint,request.method,resp.status_code)
+    return resp
+
+@app.teardown_request
+def _abort_request(exc):
+    _stop_profiler()
+    if "metrics_t0" in g: metrics.end_request(g.pop("metrics_t0"),request.endpoint,request.method,500)
+
+def load_doctor_cards():
+    return [DoctorCard(d.id,d.name,d.specialty,d.hospital,bool(d.available)) for d in Doctor.query.order_by(Doctor.id)]
+
+def load_directory_version():
+    return db.session.execute(select(DirectoryVersion.version).where(DirectoryVersion.id==1)).scalar()
+
+_BUMP_DIRECTORY = DirectoryVersion.__table__.update().where(DirectoryVersion.__table__.c.id==1) \
+    .values(version=DirectoryVersion.__table__.c.version+1)
+
+# Specialty/remedy resolution and the doctor roster, held in memory. This process re-reads the
+# roster right after committing a change to the doctors table; the others within
+# DIRECTORY_CHECK_INTERVAL seconds, when they see directory_version move.
+DIRECTORY_CHECK_INTERVAL = float(os.environ.get("DIRECTORY_CHECK_INTERVAL","5"))
+directory = ReferenceDirectory(DS, REMEDIES, GENERIC, load_doctor_cards,
+                               load_version=load_directory_version, check_every=DIRECTORY_CHECK_INTERVAL)
+
+def _doctors_changed(sess):
+    if sess.info.get("doctors_changed"): return
+    sess.info["doctors_changed"]=True
+    sess.execute(_BUMP_DIRECTORY)                  # once per transaction, committed with the change itself
+
+@event.listens_for(db.session, "before_flush")
+def _track_doctor_changes(sess, ctx, instances):
+    if any(isinstance(o,Doctor) for o in (*sess.new,*sess.dirty,*sess.deleted)): _doctors_changed(sess)
+
+@event.listens_for(db.session, "do_orm_execute")
+def _track_bulk_doctor_changes(state):
+    """Bulk update()/delete() on Doctor (including Query.update) bypasses the flush."""
+    if (state.is_update or state.is_delete) and state.bind_mapper is Doctor.__mapper__: _doctors_changed(state.session)
+
+@event.listens_for(db.session, "after_commit")
+def _refresh_directory(sess):
+    if sess.info.pop("doctors_changed",False): directory.invalidate()
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_doctor_changes(sess): sess.info.pop("doctors_changed",None)
+
+def refresh_directory():
+    """Bump directory_version so every worker re-reads the doctor roster; returns the new version."""
+    db.session.execute(_BUMP_DIRECTORY); db.session.commit()
+    directory.invalidate()
+    return load_directory_version()
+
+@app.route("/api/directory/refresh",methods=["POST"])
+@admin_required
+def refresh_directory_endpoint():
+    """For changes to the doctors table made outside the app (see `flask --app app refresh-directory`)."""
+    return jsonify(version=refresh_directory())
+
+@app.cli.command("refresh-directory")
+def refresh_directory_command():
+    """Make every worker re-read the doctor roster after the doctors table was edited outside the app."""
+    click.echo(f"Directory version {refresh_directory()}; workers reload within {DIRECTORY_CHECK_INTERVAL:g}s")
+
+def rollup_counts(rows):
+    """(Counter of (day, top_prediction), Counter of (day, symptom)) over history row dicts."""
+    preds,syms=Counter(),Counter()
+    for r in rows:
+        day=(r.get("timestamp") or datetime.utcnow()).date()
+        if r.get("top_prediction"): preds[day,r["top_prediction"]]+=1
+        for c in set(json.loads(r.get("resolved") or "[]")): syms[day,c]+=1
+    return preds,syms
+
+def _on_conflict(insert):
+    def upsert(model,values):
+        t=model.__table__; stmt=insert(t).values(values)
+        return stmt.on_conflict_do_update(index_elements=["day",model.KEY],set_={"searches":t.c.searches+stmt.excluded.searches})
+    return upsert
+
+def _on_duplicate_key(model,values):
+    t=model.__table__; stmt=mysql.insert(t).values(values)
+    return stmt.on_duplicate_key_update(searches=t.c.searches+stmt.inserted.searches)
+
+# "Add these counts" upserts per backend; elsewhere the rollups are only filled by rebuild-rollups.
+_UPSERT = {"sqlite":_on_conflict(sqlite.insert),"postgresql":_on_conflict(postgresql.insert),
+           "mysql":_on_duplicate_key,"mariadb":_on_duplicate_key}
+ROLLUP_CHUNK = 500                                  # rollup rows per upsert statement
+
+_db_backend = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+if _db_backend not in _UPSERT:
+    app.logger.warning("Daily rollups are not maintained on %s; recount them with `flask --app app rebuild-rollups`",
+                       _db_backend)
+
+def _bump_rollups(rows):
+    upsert=_UPSERT.get(db.engine.dialect.name)
+    if upsert is None: return
+    for model,counts in zip((PredictionDaily,SymptomDaily),rollup_counts(rows)):
+        values=[{"day":d,model.KEY:k,"searches":n} for (d,k),n in counts.items()]
+        for at in range(0,len(values),ROLLUP_CHUNK):
+            db.session.execute(upsert(model,values[at:at+ROLLUP_CHUNK]))
+
+def _drop_rollups(rows):
+    """Take deleted history rows back out of the daily rollups; counts that reach zero are removed."""
+    for model,counts in zip((PredictionDaily,SymptomDaily),rollup_counts(rows)):
+        if not counts: continue
+        t=model.__table__
+        match=(t.c.day==bindparam("d"))&(t.c[model.KEY]==bindparam("k"))
+        db.session.execute(t.update().where(match).values(searches=t.c.searches-bindparam("n")),
+                           [dict(d=d,k=k,n=n) for (d,k),n in counts.items()])
+        db.session.execute(t.delete().where(match&(t.c.searches<=0)),[dict(d=d,k=k) for d,k in counts])
+
+def insert_history(rows):
+    """Insert history rows and fold them into the daily rollups in one transaction."""
+    db.session.execute(db.insert(SearchHistory),rows); _bump_rollups(rows); db.session.commit()
+
+def _write_history_batch(rows):
+    with app.app_context():
+        try: insert_history(rows)
+        except: db.session.rollback(); raise
+
+# HISTORY_WRITE_BEHIND=1 queues SearchHistory rows and inserts them in batches off the request thread.
+history_writer = None
+if os.environ.get("HISTORY_WRITE_BEHIND","0")=="1":
+    history_writer = HistoryWriter(_write_history_batch,
+        max_queue=int(os.environ.get("HISTORY_QUEUE_SIZE","10000")),
+        batch_size=int(os.environ.get("HISTORY_BATCH_SIZE","200")),
+        flush_interval=float(os.environ.get("HISTORY_FLUSH_INTERVAL","1.0")))
+
+class KeysetPage:
+    def __init__(self, items, newer=None, older=None): self.items,self.newer,self.older=items,newer,older
+
+def _cursor(ts, rid): return f"{ts:%Y%m%d%H%M%S%f}-{rid}"
+
+def _parse_cursor(c):
+    try: ts,rid=c.split("-"); return datetime.strptime(ts,"%Y%m%d%H%M%S%f"),int(rid)
+    except (AttributeError,ValueError): return None
+
+def keyset_page(query, ts_col, id_col, per_page=20):
+    """Newest-first page over (ts_col, id_col) using ?older=/?newer= cursors instead of OFFSET and COUNT."""
+    key=db.tuple_(ts_col,id_col)
+    older,newer=_parse_cursor(request.args.get("older")),_parse_cursor(request.args.get("newer"))
+    if newer:
+        rows=query.filter(key>newer).order_by(ts_col.asc(),id_col.asc()).limit(per_page+1).all()
+        more,rows=len(rows)>per_page,rows[:per_page][::-1]
+        has_newer,has_older=more,True
+    else:
+        if older: query=query.filter(key<older)
+        rows=query.order_by(ts_col.desc(),id_col.desc()).limit(per_page+1).all()
+        more,rows=len(rows)>per_page,rows[:per_page]
+        has_newer,has_older=bool(older),more
+    cur=lambda r: _cursor(getattr(r,ts_col.key),getattr(r,id_col.key))
+    return KeysetPage(rows,cur(rows[0]) if rows and has_newer else None,cur(rows[-1]) if rows and has_older else None)
+
+def clean_query(text): return re.sub(r'[^a-zA-Z0-9\s,\-]','',text.strip())
+
+def split_symptoms(text): return [t.strip() for t in text.replace(';',',').split(',') if t.strip()]
+
+# PREDICT_MODE=model scores with the trained forest; the default counts matching dataset rows.
+PREDICT_MODE = os.environ.get("PREDICT_MODE","dataset").lower()
+BATCH_LIMIT = int(os.environ.get("BATCH_LIMIT","1000"))
+MODEL_PATH = os.environ.get("MODEL_PATH",os.path.join(BASE_DIR,"disease_model.pkl"))
+# The registry's active version wins; MODEL_PATH is served when nothing has been registered.
+# Loaded on first use and re-checked every MODEL_CHECK_INTERVAL seconds, so activating a
+# version swaps it in without a restart.
+MODEL_REGISTRY = os.environ.get("MODEL_REGISTRY",os.path.join(BASE_DIR,"models"))
+registry = ModelRegistry(MODEL_REGISTRY)
+models = LiveModel(registry,fallback=(MODEL_PATH,os.path.join(os.path.dirname(MODEL_PATH),"label_encoder.pkl")),
+                   interval=float(os.environ.get("MODEL_CHECK_INTERVAL","5")))
+
+# DATASET_FILES (os.pathsep-separated) names the candidates explicitly; those are used even
+# when their columns don't overlap the model's symptoms.
+DATASET_FILES = tuple(f for f in os.environ.get("DATASET_FILES","").split(os.pathsep) if f) \
+    or tuple(os.path.join(BASE_DIR,f) for f in ("sample_dataset.csv","data.csv","dataset.csv"))
+DATASET_RELOAD_INTERVAL = float(os.environ.get("DATASET_RELOAD_INTERVAL","5"))
+def _model_symptoms(cols):
+    known={s.lower() for s in models.info()[0]}
+    return any(c.lower().replace(" ","_") in known for c in cols)
+store = DatasetStore(DATASET_FILES, interval=DATASET_RELOAD_INTERVAL,
+                     accept=None if os.environ.get("DATASET_FILES") else _model_symptoms)
+store.reload()
+store.listeners.append(lambda snap: directory.warm(snap.diseases))
+directory.warm(store.snapshot.diseases + models.info()[1])
+if not models.info()[0]: app.logger.warning("No model in %s or at %s", MODEL_REGISTRY, MODEL_PATH)
+
+# Repeated symptom combinations skip matching, remedies and specialty lookup.
+result_cache = ResultCache(maxsize=int(os.environ.get("RESULT_CACHE_SIZE","1024")),
+                           ttl=float(os.environ.get("RESULT_CACHE_TTL","0")))
+store.listeners.append(result_cache.clear)
+models.listeners.append(result_cache.clear)
+models.listeners.append(lambda model: model and directory.warm(model.classes))
+
+metrics.add_source("result_cache",result_cache.stats,("hits","misses","evictions","expirations","invalidations"))
+metrics.add_source("dataset",lambda: dict(rows=store.snapshot.rows,symptoms=len(store.snapshot.symptoms),
+                                          diseases=len(store.snapshot.diseases)))
+metrics.add_source("model",models.stats,("swaps","failures"))
+if history_writer:
+    metrics.add_source("history_writer",history_writer.stats,("enqueued","written","dropped","failed","batches"))
+
+def rank_diseases(req, snap, model):
+    """Scores plus remedies/specialty for the top disease, memoised per symptom set and data version.
+
+    `model` is the DiseaseModel to score with, or None to rank by dataset rows.
+    """
+    key=("model",model.version) if model else ("dataset",snap.version)
+    key+=(tuple(sorted(set(req))),)
+    hit=result_cache.get(key)
+    if hit is None:
+        top,scores,matched,rem,spec,approx=[],[],[],"","",False
+        with metrics.span("predict","score"):
+            if model:
+                top=scores=model.predict([req])[0] if req else []
+                matched=[d for d,_ in scores]
+            else:
+                res=snap.match(req); matched=res.matched
+                if res.ranked:
+                    top=res.ranked[:20]; scores=[(d,c/res.total) for d,c in top]
+                elif req and not res.total:       # no row has all of them: rank by per-symptom statistics
+                    top=scores=snap.stats.rank(req); matched=[d for d,_ in scores]; approx=bool(scores)
+        if scores: rem,spec=directory.remedies(str(scores[0][0])),directory.specialty(str(scores[0][0]))
+        hit=dict(top=top,scores=scores,matched=matched,remedies=rem,specialty=spec,approximate=approx)
+        result_cache.put(key,hit)
+    return hit
+
+# Threads don't survive fork, so the dataset watcher and history writer start in the process
+# that serves requests: on its first request, or from gunicorn's post_fork hook.
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background():
+    global _background_started
+    if _background_started: return
+    with _background_lock:
+        if _background_started: return
+        store.start_watcher()
+        if history_writer: history_writer.start()
+        if METRICS_DIR: metrics.share(METRICS_DIR)
+        _background_started = True
+
+@app.before_request
+def _ensure_background(): start_background()
 
 # ── Auth ─────────────────────────────────────────────────────────────────
 @app.route("/register",methods=["GET","POST"])
@@ -236,28 +623,36 @@ def home():
 @app.route("/history")
 @login_required
 def history():
-    pg=request.args.get('page',1,type=int)
-    searches=SearchHistory.query.filter_by(user_id=session['user_id']).order_by(SearchHistory.timestamp.desc()).paginate(page=pg,per_page=20,error_out=False)
+    searches=keyset_page(SearchHistory.query.filter_by(user_id=session['user_id']),
+                         SearchHistory.timestamp,SearchHistory.id)
     return render_template("history.html",searches=searches)
 
 @app.route("/history/delete/<int:rid>",methods=["POST"])
 @login_required
 def delete_history(rid):
     r=SearchHistory.query.filter_by(id=rid,user_id=session['user_id']).first_or_404()
+    _drop_rollups([dict(timestamp=r.timestamp,top_prediction=r.top_prediction,resolved=r.resolved)])
     db.session.delete(r); db.session.commit(); flash("Deleted.","success")
     return redirect(url_for('history'))
 
 @app.route("/history/clear",methods=["POST"])
 @login_required
 def clear_history():
-    SearchHistory.query.filter_by(user_id=session['user_id']).delete(); db.session.commit()
+    t=SearchHistory.__table__
+    rows=db.session.execute(select(t.c.id,t.c.timestamp,t.c.top_prediction,t.c.resolved)
+                            .where(t.c.user_id==session['user_id'])).mappings().all()
+    if rows:
+        _drop_rollups(rows)     # same transaction; searches saved meanwhile (higher ids) are kept
+        db.session.execute(t.delete().where(t.c.user_id==session['user_id'],t.c.id<=max(r["id"] for r in rows)))
+    db.session.commit()
     flash("History cleared.","success"); return redirect(url_for('history'))
 
 @app.route("/appointments")
 @login_required
 def appointments():
-    appts=Appointment.query.filter_by(user_id=session['user_id']).order_by(Appointment.booked_at.desc()).all()
-    return render_template("appointments.html",appointments=appts)
+    page=keyset_page(Appointment.query.options(joinedload(Appointment.doctor)).filter_by(user_id=session['user_id']),
+                     Appointment.booked_at,Appointment.id)
+    return render_template("appointments.html",appointments=page.items,page=page)
 
 @app.route("/book/<int:doctor_id>",methods=["POST"])
 @login_required
@@ -267,13 +662,58 @@ def book_appointment(doctor_id):
     appt_time=request.form.get("appt_time","")
     if not appt_date or not appt_time:
         flash("Please select a date and time.","error"); return redirect(url_for('predict'))
-    doctor=Doctor.query.get_or_404(doctor_id)
-    db.session.add(Appointment(user_id=session['user_id'],doctor_id=doctor_id,
-                               disease=disease,appt_date=appt_date,appt_time=appt_time))
-    db.session.commit()
-    flash(f"✅ Appointment booked with {doctor.name} on {appt_date} at {appt_time}!","success")
+    slot=parse_slot(appt_date,appt_time)
+    if slot is None or slot<=datetime.now():
+        flash("Please pick one of the listed times on a future date.","error"); return redirect(url_for('predict'))
+    name=Doctor.query.get_or_404(doctor_id).name
+    # Claim the slot with a plain INSERT: the unique (doctor, slot) index decides between
+    # concurrent bookings, so there is no read-then-write window.
+    db.session.add(Appointment(user_id=session['user_id'],doctor_id=doctor_id,disease=disease,slot_start=slot,
+                               appt_date=slot.strftime("%Y-%m-%d"),appt_time=slot_label(slot)))
+    try: db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash(f"{name} is already booked on {slot:%Y-%m-%d} at {slot_label(slot)}. Please choose another time.","error")
+        return redirect(url_for('predict'))
+    flash(f"✅ Appointment booked with {name} on {slot:%Y-%m-%d} at {slot_label(slot)}!","success")
     return redirect(url_for('appointments'))
 
+@app.route("/api/availability")
+@api_login_required
+def availability():
+    """Open slots per doctor over a date range.
+
+    ?specialty=Cardiologist (every available doctor with it) or ?doctor=<id>, plus start=YYYY-MM-DD (default
+    today) and days (default 7, at most AVAILABILITY_MAX_DAYS). Booked slots come from one range
+    scan of the (doctor_id, slot_start) index.
+    """
+    try: start=datetime.strptime(request.args.get("start") or date.today().isoformat(),"%Y-%m-%d").date()
+    except ValueError: return jsonify(error="'start' must be YYYY-MM-DD."),400
+    days=max(1,min(request.args.get("days",7,type=int),AVAILABILITY_MAX_DAYS))
+    if request.args.get("doctor"):
+        d=db.session.get(Doctor,request.args.get("doctor",0,type=int))
+        if d is None: return jsonify(error="Unknown doctor."),404
+        doctors=[DoctorCard(d.id,d.name,d.specialty,d.hospital,bool(d.available))]
+    elif request.args.get("specialty"):
+        staff=Doctor.query.filter_by(specialty=request.args["specialty"]).order_by(Doctor.id).all()
+        if not staff: return jsonify(error="Unknown specialty."),404
+        doctors=[DoctorCard(d.id,d.name,d.specialty,d.hospital,True) for d in staff if d.available]
+    else: return jsonify(error="Pass 'specialty' or 'doctor'."),400
+    lo=datetime.combine(start,datetime.min.time()); hi=lo+timedelta(days=days)
+    taken=set(db.session.execute(select(Appointment.doctor_id,Appointment.slot_start).where(
+        Appointment.doctor_id.in_([d.id for d in doctors]),Appointment.slot_start>=lo,Appointment.slot_start<hi)).all())
+    now=datetime.now()
+    out=[]
+    for d in doctors:
+        slots={}
+        for i in range(days):
+            day=start+timedelta(days=i)
+            free=[t.strftime("%H:%M") for t in SLOT_TIMES
+                  if (s:=datetime.combine(day,t))>now and (d.id,s) not in taken]
+            if free: slots[day.isoformat()]=free
+        out.append(dict(id=d.id,name=d.name,specialty=d.specialty,hospital=d.hospital,slots=slots))
+    return jsonify(start=start.isoformat(),days=days,doctors=out)
+
 @app.route("/appointments/cancel/<int:appt_id>",methods=["POST"])
 @login_required
 def cancel_appointment(appt_id):
@@ -285,41 +725,208 @@ def cancel_appointment(appt_id):
 @login_required
 def predict():
     err,sq,scores,rem,docs,spec="","",[],"",[],"",
-    matched,top=[],[]
-    df=load_df(); cols=list(df.columns) if not df.empty else []
-    syms=[c for c in symptom_columns if c in df.columns]
+    matched,top,related,approx=[],[],[],False
+    snap=store.snapshot; cols=snap.columns
+    model=models.get() if PREDICT_MODE=="model" else None
 
     if request.method=="POST":
-        sq=re.sub(r'[^a-zA-Z0-9\s,\-]','',request.form.get("search_symptoms","").strip())
+        sq=clean_query(request.form.get("search_symptoms",""))
         if not sq: err="Please enter at least one symptom."
         else:
-            col_map={str(c).lower().strip().replace(" ","_").replace("-","_"):str(c) for c in df.columns}
-            req=[]
-            for t in [t.strip() for t in sq.replace(';',',').split(',') if t.strip()]:
-                k=t.lower().replace(" ","_").replace("-","_")
-                m=col_map.get(k) or next((v for nk,v in col_map.items() if k in nk or nk in k),None)
-                if m: req.append(m)
-            rows=[(i,r) for i,r in df.iterrows() if all(to_int(r.get(c,0)) for c in req)]
-            diseases=[str(d) for _,r in rows for d in [r.get("Disease") or r.get("disease") or r.get("prognosis")]
-                      if d and str(d).strip().lower() not in ("no disease","none","nan","no")]
-            matched=list(dict.fromkeys(diseases))
-            if diseases:
-                cnt=Counter(diseases); top=cnt.most_common(20); total=len(rows)
-                scores=[(d,c/total) for d,c in top]
-                rem=get_remedies(str(scores[0][0]))
-                docs,spec=get_doctors(str(scores[0][0]))
-                try:
-                    alts=[{"disease":str(d),"confidence":round(float(c),4)} for d,c in scores[1:6]]
-                    db.session.add(SearchHistory(user_id=session['user_id'],symptoms=sq,
-                        top_prediction=str(scores[0][0]),confidence=float(scores[0][1]),alternatives=json.dumps(alts)))
-                    db.session.commit()
-                except: db.session.rollback()
+            with metrics.span("predict","resolve"):
+                req,_=(model or snap).resolver.resolve(split_symptoms(sq))
+            with metrics.span("predict","rank"): r=rank_diseases(req,snap,model)
+            top,scores,matched,approx=r["top"],r["scores"],r["matched"],r["approximate"]
+            with metrics.span("predict","related"): related=snap.stats.related(req)
+            if scores:
+                rem=r["remedies"]
+                spec=r["specialty"]
+                with metrics.span("predict","doctors"): docs=directory.doctors(spec)
+                alts=[{"disease":str(d),"confidence":round(float(c),4)} for d,c in scores[1:6]]
+                row=dict(user_id=session['user_id'],symptoms=sq,top_prediction=str(scores[0][0]),
+                         confidence=float(scores[0][1]),alternatives=json.dumps(alts),resolved=json.dumps(req),
+                         timestamp=datetime.utcnow())
+                with metrics.span("predict","history"):
+                    if history_writer: history_writer.submit(row)
+                    else:
+                        try: insert_history([row])
+                        except: db.session.rollback()
             elif not req: err=f"No matching symptoms found for: {sq}"
 
-    return render_template("predict.html",remedies=rem,symptoms=symptom_columns,error=err,
-        search_symptoms=sq,top_diseases=top,confidence_scores=scores,matched_diseases=matched,
-        recommended_doctors=docs,recommended_specialty=spec,prediction="",
-        data_columns=cols,matched_examples=[],available_columns=cols)
+    with metrics.span("predict","render"):
+        return render_template("predict.html",remedies=rem,error=err,
+            symptoms=model.feature_names if model else snap.symptoms,
+            search_symptoms=sq,top_diseases=top,confidence_scores=scores,matched_diseases=matched,
+            recommended_doctors=docs,recommended_specialty=spec,prediction="",approximate=approx,
+            related_symptoms=related,slot_times=SLOT_TIMES,now=datetime.now(),
+            data_columns=cols,matched_examples=[],available_columns=cols)
+
+@app.route("/api/symptoms/suggest")
+@api_login_required
+def suggest_symptoms():
+    model=models.get() if PREDICT_MODE=="model" else None
+    resolver=(model or store.snapshot).resolver
+    limit=max(1,min(request.args.get("limit",8,type=int),25))
+    return jsonify(suggestions=[{"value":c,"label":c.replace("_"," ")}
+                                for c in resolver.suggest(request.args.get("q",""),limit)])
+
+@app.route("/api/cache/stats")
+@monitoring_required
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route("/api/history/writer/stats")
+@monitoring_required
+def history_writer_stats():
+    return jsonify(history_writer.stats() if history_writer else {"enabled":False})
+
+@app.route("/api/model")
+@monitoring_required
+def model_info():
+    model=models.get()
+    active=registry.active_version()
+    try: meta=registry.meta(active) if active else None
+    except (OSError,ValueError): meta=None
+    return jsonify(serving=model.version if model else None,active=active,metrics=(meta or {}).get("metrics"),
+                   compact=bool(meta and meta.get("compact")),**models.stats())
+
+@app.route("/metrics")
+@monitoring_required
+def prometheus_metrics():
+    return Response(metrics.render(),mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/predict/batch",methods=["POST"])
+@api_login_required
+def predict_batch():
+    """Score many symptom sets with one predict_proba call.
+
+    Body: {"queries": ["fever, cough", ["headache","nausea"], ...], "top": 5}
+    """
+    model=models.get()
+    if model is None: return jsonify(error="Model not loaded."),503
+    body=request.get_json(silent=True) or {}
+    queries=body.get("queries")
+    if not isinstance(queries,list) or not queries: return jsonify(error="'queries' must be a non-empty list."),400
+    if len(queries)>BATCH_LIMIT: return jsonify(error=f"At most {BATCH_LIMIT} queries per batch."),413
+    try: top=max(1,min(int(body.get("top",5)),20))
+    except (TypeError,ValueError): return jsonify(error="'top' must be an integer."),400
+    parsed=[]
+    for q in queries:
+        if isinstance(q,str):    tokens=split_symptoms(clean_query(q))
+        elif isinstance(q,list): tokens=[t for t in (clean_query(str(x)) for x in q) if t]
+        else:                    tokens=[]
+        parsed.append(model.resolver.resolve(tokens))
+    scorable=[i for i,(req,_) in enumerate(parsed) if req]
+    with metrics.span("predict_batch","score"):
+        preds=dict(zip(scorable,model.predict([parsed[i][0] for i in scorable],top=top)))
+    return jsonify(model=model.version,results=[
+        {"symptoms":req,"unknown":unknown,
+         "predictions":[{"disease":d,"confidence":round(p,4)} for d,p in preds.get(i,[])]}
+        for i,(req,unknown) in enumerate(parsed)])
+
+# ── Export & analytics ───────────────────────────────────────────────────
+EXPORT_COLUMNS = ("id","user_id","timestamp","symptoms","resolved","top_prediction","confidence","alternatives")
+EXPORT_BATCH = 5000                                 # rows per cursor fetch / encoded chunk
+
+def _day_arg(name):
+    """?name=YYYY-MM-DD as a date, None when absent; ValueError when malformed."""
+    v=request.args.get(name)
+    return datetime.strptime(v,"%Y-%m-%d").date() if v else None
+
+def history_batches(since=None, until=None, batch=EXPORT_BATCH):
+    """search_history rows in id order, `batch` at a time, from one server-side cursor."""
+    t=SearchHistory.__table__
+    q=select(*(t.c[c] for c in EXPORT_COLUMNS)).order_by(t.c.id)
+    if since: q=q.where(t.c.timestamp>=datetime.combine(since,datetime.min.time()))
+    if until: q=q.where(t.c.timestamp<datetime.combine(until,datetime.min.time()))
+    with db.engine.connect() as conn:
+        yield from conn.execution_options(stream_results=True,yield_per=batch).execute(q).partitions()
+
+@app.route("/api/history/export")
+@admin_required
+def export_history():
+    """Stream every search as ?format=csv (default), ndjson or parquet; since/until=YYYY-MM-DD (until exclusive)."""
+    fmt=request.args.get("format","csv").lower()
+    if fmt not in history_export.FORMATS: return jsonify(error=f"'format' must be one of {', '.join(history_export.FORMATS)}."),400
+    if not history_export.available(fmt): return jsonify(error="Parquet export needs pyarrow installed."),501
+    try: since,until=_day_arg("since"),_day_arg("until")
+    except ValueError: return jsonify(error="'since' and 'until' must be YYYY-MM-DD."),400
+    chunks=history_export.encode(history_batches(since,until),EXPORT_COLUMNS,fmt,history_export.arrow_types(EXPORT_COLUMNS))
+    return Response(stream_with_context(chunks),mimetype=history_export.MIMETYPES[fmt],
+                    headers={"Content-Disposition":f"attachment; filename=search_history.{fmt}"})
+
+@app.route("/api/analytics/<kind>")
+@admin_required
+def analytics(kind):
+    """Top predictions or resolved symptoms with their counts per day or week, read from the rollups.
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive, default the last 30 days), bucket=day|week, top=10.
+    """
+    model={"predictions":PredictionDaily,"symptoms":SymptomDaily}.get(kind)
+    if model is None: return jsonify(error="Use /api/analytics/predictions or /api/analytics/symptoms."),404
+    try:
+        end=_day_arg("end") or datetime.utcnow().date()
+        start=_day_arg("start") or end-timedelta(days=29)
+    except ValueError: return jsonify(error="'start' and 'end' must be YYYY-MM-DD."),400
+    bucket=request.args.get("bucket","day")
+    if bucket not in ("day","week"): return jsonify(error="'bucket' must be day or week."),400
+    top=max(1,min(request.args.get("top",10,type=int),100))
+    key,in_range,total=getattr(model,model.KEY),model.day.between(start,end),db.func.sum(model.searches)
+    leaders=db.session.execute(select(key,total).where(in_range).group_by(key).order_by(total.desc(),key).limit(top)).all()
+    series={k:{} for k,_ in leaders}
+    for d,k,n in db.session.execute(select(model.day,key,model.searches).where(in_range,key.in_(list(series)))):
+        b=(d-timedelta(days=d.weekday()) if bucket=="week" else d).isoformat()
+        series[k][b]=series[k].get(b,0)+n
+    return jsonify(kind=kind,start=start.isoformat(),end=end.isoformat(),bucket=bucket,
+                   results=[{"key":k,"total":int(n),"series":series[k]} for k,n in leaders])
+
+def rebuild_rollups(batch=EXPORT_BATCH):
+    """Recount both rollup tables from search_history; returns the number of rows scanned.
+
+    Rows written before `resolved` existed get it filled in with the current resolver. Searches
+    saved while this runs may be left out of the recount, so run it off-peak.
+    """
+    t=SearchHistory.__table__
+    resolver=((models.get() if PREDICT_MODE=="model" else None) or store.snapshot).resolver
+    fill=t.update().where(t.c.id==bindparam("hid")).values(resolved=bindparam("cols"))
+    preds,syms,scanned=Counter(),Counter(),0
+    with db.engine.connect() as conn:
+        q=select(t.c.id,t.c.timestamp,t.c.top_prediction,t.c.symptoms,t.c.resolved)
+        for part in conn.execution_options(stream_results=True,yield_per=batch).execute(q).partitions():
+            rows,backfill=[],[]
+            for hid,ts,top,raw,resolved in part:
+                if resolved is None:
+                    resolved=json.dumps(resolver.resolve(split_symptoms(clean_query(raw or "")))[0])
+                    backfill.append(dict(hid=hid,cols=resolved))
+                rows.append(dict(timestamp=ts,top_prediction=top,resolved=resolved))
+            p,s=rollup_counts(rows); preds.update(p); syms.update(s); scanned+=len(rows)
+            if backfill:
+                with db.engine.begin() as w: w.execute(fill,backfill)
+    with db.engine.begin() as conn:
+        for model,counts in ((PredictionDaily,preds),(SymptomDaily,syms)):
+            conn.execute(model.__table__.delete())
+            values=[{"day":d,model.KEY:k,"searches":n} for (d,k),n in counts.items()]
+            if values: conn.execute(model.__table__.insert(),values)
+    return scanned
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recount the daily prediction/symptom rollups from search_history."""
+    click.echo(f"Recounted rollups over {rebuild_rollups()} searches")
+
+@app.cli.command("export-history")
+@click.option("--format","fmt",type=click.Choice(history_export.FORMATS),default="csv",show_default=True)
+@click.option("--since",type=click.DateTime(["%Y-%m-%d"]),help="First day to include")
+@click.option("--until",type=click.DateTime(["%Y-%m-%d"]),help="First day to leave out")
+@click.option("--output","-o",default="-",help="Output file ('-' for stdout)")
+def export_history_command(fmt, since, until, output):
+    """Write search_history as CSV, NDJSON or Parquet in constant memory."""
+    if not history_export.available(fmt): raise click.ClickException("Parquet export needs pyarrow installed.")
+    chunks=history_export.encode(history_batches(since and since.date(),until and until.date()),EXPORT_COLUMNS,
+                                 fmt,history_export.arrow_types(EXPORT_COLUMNS))
+    with click.open_file(output,"wb") as out:        # "-" is stdout, left open
+        for chunk in chunks: out.write(chunk)
 
 if __name__=="__main__":
+    init_db()
     app.run(debug=True)
\ No newline at end of file
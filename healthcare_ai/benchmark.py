@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Benchmark and load-test the prediction, history, booking and availability paths.
+
+For every grid point (symptoms x rows x diseases) a dataset is generated with
+generate_sample_dataset.py, a throwaway SQLite database is seeded with users and
+search history, and each endpoint is driven twice, each time in a fresh process
+so its peak RSS is its own:
+
+  client  Flask test client, one thread: request handling cost without networking
+  http    local threaded HTTP server with --threads concurrent logged-in clients
+
+Dataset loading (CSV parse vs memory-mapped .symds) is timed in-process as "load_csv"
+and "load_symds". Every result has throughput, p50/p95/p99/mean latency, error count
+and peak RSS; the whole run is saved as JSON so runs on two commits can be compared.
+The exit status is 1 when a --threshold is exceeded or, with --compare, when p95
+latency, throughput or peak RSS regressed by more than --max-regression.
+
+App settings such as HISTORY_WRITE_BEHIND or PREDICT_MODE are passed through from the
+environment, so configurations can be compared the same way as commits.
+
+Usage examples:
+  python3 benchmark.py                                        # default grid -> bench_results.json
+  python3 benchmark.py --grid 1000x50000x13 --requests 1000 --threads 16 -o before.json
+  python3 benchmark.py -o after.json --compare before.json --max-regression 0.2
+  python3 benchmark.py --threshold predict.p95_ms=50 --threshold peak_rss_mb=1500
+  python3 benchmark.py --results after.json --compare before.json   # compare without running
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from http.cookiejar import CookieJar
+
+import numpy as np
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GRID = "100x2000x13,1000x20000x13"
+ENDPOINTS = ("predict", "history", "book", "availability")
+DRIVERS = ("client", "http")
+PASSWORD = "benchpass"
+MAX_METRICS = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "peak_rss_mb", "errors")
+MIN_METRICS = ("throughput_rps",)
+
+
+def parse_grid(text):
+    """"SxRxD,..." -> [(symptoms, rows, diseases)]."""
+    out = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        s, r, d = (int(x) for x in part.lower().split("x"))
+        out.append((s, r, d))
+    return out
+
+
+def disease_names(n):
+    from generate_sample_dataset import DEFAULT_DISEASES
+    return (DEFAULT_DISEASES + [f"Disease {i:03d}" for i in range(len(DEFAULT_DISEASES), n)])[:n]
+
+
+def peak_rss_mb() -> float:
+    rss = psutil.Process().memory_info().rss
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024   # ru_maxrss is bytes on macOS, KiB on Linux
+        rss = max(rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+    return round(rss / 2**20, 1)
+
+
+def summarize(latencies, errors, wall):
+    ms = np.asarray(latencies, dtype=float) * 1000
+    pct = np.percentile(ms, [50, 95, 99]) if ms.size else [float("nan")] * 3
+    return dict(requests=len(ms), errors=errors, throughput_rps=round(len(ms) / wall, 1) if wall else 0.0,
+                p50_ms=round(float(pct[0]), 3), p95_ms=round(float(pct[1]), 3), p99_ms=round(float(pct[2]), 3),
+                mean_ms=round(float(ms.mean()), 3) if ms.size else float("nan"))
+
+
+# ── Worker side (one process per measurement) ───────────────────────────
+def typed_query(columns) -> str:
+    """What a user would type for these symptom columns: spaces, not underscores (clean_query drops "_")."""
+    return ", ".join(c.replace("_", " ") for c in columns)
+
+
+def request_plan(endpoint, spec, rng):
+    """Endless (method, path, form) requests for `endpoint`."""
+    today = date.today()
+    if endpoint == "predict":
+        pool = [typed_query(rng.sample(spec["symptoms"], rng.randint(1, 3))) for _ in range(spec["query_pool"])]
+        while True: yield "POST", "/predict", {"search_symptoms": rng.choice(pool)}
+    elif endpoint == "history":
+        start = datetime.utcnow() - timedelta(days=spec["history_days"])
+        while True:
+            if rng.random() < 0.5: yield "GET", "/history", None
+            else:   # a deep page: keyset cursor at a random point of the seeded history
+                at = start + timedelta(seconds=rng.randrange(spec["history_days"] * 86400))
+                yield "GET", f"/history?older={at:%Y%m%d%H%M%S%f}-{2**31 - 1}", None
+    elif endpoint == "book":
+        import app as A     # already imported by the worker; the form offers exactly these times
+        slots = [A.slot_label(t) for t in A.SLOT_TIMES]
+        while True:
+            yield "POST", f"/book/{rng.randint(1, spec['doctors'])}", {
+                "disease": rng.choice(spec["diseases"]), "appt_time": rng.choice(slots),
+                "appt_date": (today + timedelta(days=rng.randint(1, 365))).isoformat()}
+    elif endpoint == "availability":
+        while True:
+            yield "GET", (f"/api/availability?doctor={rng.randint(1, spec['doctors'])}&days=7"
+                          f"&start={today + timedelta(days=rng.randint(0, 358))}"), None
+    else:
+        raise ValueError(f"unknown endpoint {endpoint}")
+
+
+def failed(status, location) -> bool:
+    return status >= 400 or (location or "").rstrip("/").endswith("/login")
+
+
+def drive_client(app, endpoint, spec, total, warmup):
+    client = app.test_client()
+    client.post("/login", data={"username": "bench0000", "password": PASSWORD})
+    plan = request_plan(endpoint, spec, random.Random(spec["seed"]))
+    lat, errors = [], 0
+    for i in range(warmup + total):
+        method, path, form = next(plan)
+        t = time.perf_counter()
+        r = client.open(path, method=method, data=form)
+        dt = time.perf_counter() - t
+        if i < warmup: continue
+        lat.append(dt); errors += failed(r.status_code, r.headers.get("Location"))
+    return lat, errors
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *a, **kw): return None
+
+
+def drive_http(app, endpoint, spec, total, warmup, threads):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def call(opener, method, path, form):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with opener.open(urllib.request.Request(base + path, data=data, method=method), timeout=60) as r:
+                r.read(); return r.status, None
+        except urllib.error.HTTPError as e:
+            e.read(); return e.code, e.headers.get("Location")
+        except OSError:
+            return 599, None
+
+    remaining, lock = [total], threading.Lock()
+    ready = threading.Barrier(threads + 1)
+    results = []
+
+    def client(n):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        call(opener, "POST", "/login", {"username": f"bench{n % spec['users']:04d}", "password": PASSWORD})
+        plan = request_plan(endpoint, spec, random.Random(spec["seed"] * 1000 + n))
+        for _ in range(warmup // threads): call(opener, *next(plan))
+        lat, errors = [], 0
+        ready.wait()
+        while True:
+            with lock:
+                if not remaining[0]: break
+                remaining[0] -= 1
+            t = time.perf_counter()
+            status, location = call(opener, *next(plan))
+            lat.append(time.perf_counter() - t); errors += failed(status, location)
+        results.append((lat, errors))
+
+    workers = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(threads)]
+    for w in workers: w.start()
+    ready.wait()
+    t0 = time.perf_counter()
+    for w in workers: w.join()
+    wall = time.perf_counter() - t0
+    server.shutdown()
+    return [x for lat, _ in results for x in lat], sum(e for _, e in results), wall
+
+
+def seed_database(spec):
+    """Users bench0000.. with `history` search rows each, spread over the last `history_days` days."""
+    import app as A
+    from werkzeug.security import generate_password_hash
+    rng = random.Random(spec["seed"])
+    pw = generate_password_hash(PASSWORD)          # hashing is deliberately slow; share one hash
+    A.init_db()
+    with A.app.app_context():
+        A.db.session.execute(A.db.insert(A.User), [dict(username=f"bench{i:04d}", password_hash=pw)
+                                                   for i in range(spec["users"])])
+        A.db.session.commit()
+        ids = [u.id for u in A.User.query.order_by(A.User.id)]
+        now, span = datetime.utcnow(), spec["history_days"] * 86400
+        rows = []
+        for uid in ids:
+            for _ in range(spec["history"]):
+                cols = rng.sample(spec["symptoms"], rng.randint(1, 3))
+                rows.append(dict(user_id=uid, symptoms=typed_query(cols), resolved=json.dumps(cols),
+                                 top_prediction=rng.choice(spec["diseases"]), confidence=rng.random(),
+                                 alternatives="[]", timestamp=now - timedelta(seconds=rng.randrange(span))))
+            if len(rows) >= 5000: A.insert_history(rows); rows = []
+        if rows: A.insert_history(rows)
+        return dict(users=len(ids), history=len(ids) * spec["history"], doctors=A.Doctor.query.count())
+
+
+def run_worker(spec):
+    """Runs one task described by `spec` and returns its JSON-able result."""
+    task = spec["task"]
+    if task == "seed": return seed_database(spec)
+    if task in ("load_csv", "load_symds"):
+        import binary_dataset
+        from dataset_store import DatasetSnapshot
+        load = (lambda: DatasetSnapshot.from_csv(spec["csv"])) if task == "load_csv" else \
+            (lambda: binary_dataset.load_snapshot(spec["symds"]))
+        lat, t0 = [], time.perf_counter()
+        for _ in range(spec["load_repeats"]):
+            t = time.perf_counter(); load(); lat.append(time.perf_counter() - t)
+        return dict(summarize(lat, 0, time.perf_counter() - t0), peak_rss_mb=peak_rss_mb())
+    import app as A
+    base_rss = round(psutil.Process().memory_info().rss / 2**20, 1)
+    if spec["driver"] == "client":
+        t0 = time.perf_counter()
+        lat, errors = drive_client(A.app, task, spec, spec["requests"], spec["warmup"])
+        wall = time.perf_counter() - t0
+    else:
+        lat, errors, wall = drive_http(A.app, task, spec, spec["requests"], spec["warmup"], spec["threads"])
+    if A.history_writer: A.history_writer.stop()
+    return dict(summarize(lat, errors, wall), base_rss_mb=base_rss, peak_rss_mb=peak_rss_mb())
+
+
+# ── Parent side ──────────────────────────────────────────────────────────
+def spawn(spec, env):
+    """Run one worker task in a fresh interpreter and return its result dict."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                          cwd=HERE, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        sys.stderr.write(proc.stderr)
+        raise RuntimeError(f"worker {spec['task']} failed with exit code {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def prepare(grid, args, workdir):
+    """Generate the dataset and seed a database for one grid point; returns (spec, env)."""
+    from generate_sample_dataset import generate
+    s, r, d = grid
+    key = f"{s}x{r}x{d}"
+    folder = os.path.join(workdir, key)
+    os.makedirs(folder, exist_ok=True)
+    csv_path = os.path.join(folder, "data.csv")
+    diseases = disease_names(d)
+    if not os.path.exists(csv_path):
+        generate(s, r, csv_path, diseases, args.prevalence, args.seed, signature=min(8, s), workers=args.gen_workers,
+                 fmt="both")
+    db_path = os.path.join(folder, "bench.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix): os.remove(db_path + suffix)
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + db_path, DATASET_FILES=csv_path,
+               DATASET_RELOAD_INTERVAL="3600", SECRET_KEY="benchmark")
+    spec = dict(grid=key, csv=csv_path, symds=os.path.splitext(csv_path)[0] + ".symds", seed=args.seed,
+                symptoms=[f"symptom_{i:04d}" for i in range(1, s + 1)], diseases=diseases, users=args.users,
+                history=args.history, history_days=90, query_pool=args.query_pool, requests=args.requests,
+                warmup=args.warmup, threads=args.threads, load_repeats=args.load_repeats)
+    spec.update(spawn(dict(spec, task="seed"), env))
+    return spec, env
+
+
+def run_suite(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="symptocare-bench-")
+    results = []
+    try:
+        for grid in parse_grid(args.grid):
+            spec, env = prepare(grid, args, workdir)
+            print(f"[{spec['grid']}] seeded {spec['users']} users / {spec['history']} history rows", flush=True)
+            tasks = [(t, "inproc") for t in ("load_csv", "load_symds")] + \
+                    [(e, drv) for e in args.endpoints for drv in args.drivers]
+            for task, driver in tasks:
+                res = spawn(dict(spec, task=task, driver=driver), env)
+                results.append(dict(grid=spec["grid"], endpoint=task, driver=driver, **res))
+                print(format_row(results[-1]), flush=True)
+    finally:
+        if not args.workdir and not args.keep: shutil.rmtree(workdir, ignore_errors=True)
+    return dict(meta=run_meta(args), results=results)
+
+
+def run_meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(commit=commit, created=datetime.now().isoformat(timespec="seconds"), python=platform.python_version(),
+                platform=platform.platform(), cpus=os.cpu_count(),
+                args={k: v for k, v in vars(args).items() if k not in ("worker", "results", "compare", "threshold")})
+
+
+HEADER = f"{'grid':<16}{'endpoint':<14}{'driver':<8}{'n':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'peakMB':>9}"
+
+
+def format_row(r):
+    return (f"{r['grid']:<16}{r['endpoint']:<14}{r['driver']:<8}{r['requests']:>6}{r['errors']:>5}"
+            f"{r['throughput_rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['peak_rss_mb']:>9.1f}")
+
+
+def check_thresholds(results, thresholds):
+    """`[endpoint.]metric=value` limits; throughput is a minimum, everything else a maximum."""
+    failures = []
+    for spec in thresholds:
+        key, _, value = spec.partition("=")
+        endpoint, _, metric = key.rpartition(".")
+        if metric not in MAX_METRICS + MIN_METRICS: raise SystemExit(f"unknown metric in --threshold {spec}")
+        limit = float(value)
+        for r in results:
+            if endpoint and r["endpoint"] != endpoint: continue
+            v = r[metric]
+            if (metric in MIN_METRICS and v < limit) or (metric in MAX_METRICS and v > limit):
+                failures.append(f"{r['grid']} {r['endpoint']}/{r['driver']}: {metric} {v} breaks limit {limit}")
+    return failures
+
+
+def compare(old, new, max_regression):
+    """Print per-result changes against `old`; return regressions beyond `max_regression`."""
+    before = {(r["grid"], r["endpoint"], r["driver"]): r for r in old["results"]}
+    failures = []
+    print(f"\nvs {old['meta'].get('commit')} ({old['meta'].get('created')}):")
+    for r in new["results"]:
+        o = before.get((r["grid"], r["endpoint"], r["driver"]))
+        if not o: continue
+        change = lambda m: (r[m] - o[m]) / o[m] if o[m] else 0.0
+        print(f"  {r['grid']:<16}{r['endpoint']:<14}{r['driver']:<8} p95 {change('p95_ms'):+7.1%}  "
+              f"rps {change('throughput_rps'):+7.1%}  peak RSS {change('peak_rss_mb'):+7.1%}")
+        for metric, worse in (("p95_ms", change("p95_ms")), ("throughput_rps", -change("throughput_rps")),
+                              ("peak_rss_mb", change("peak_rss_mb"))):
+            if worse > max_regression:
+                failures.append(f"{r['grid']} {r['endpoint']}/{r['driver']}: {metric} {o[metric]} -> {r[metric]}")
+    return failures
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark the predict, history, booking and availability paths")
+    p.add_argument("--grid", default=DEFAULT_GRID, help="Comma-separated SYMPTOMSxROWSxDISEASES dataset sizes")
+    p.add_argument("--endpoints", type=lambda s: s.split(","), default=list(ENDPOINTS),
+                   help=f"Comma-separated subset of {','.join(ENDPOINTS)}")
+    p.add_argument("--drivers", type=lambda s: s.split(","), default=list(DRIVERS),
+                   help="Comma-separated subset of client,http")
+    p.add_argument("--requests", "-n", type=int, default=300, help="Measured requests per endpoint and driver")
+    p.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each run")
+    p.add_argument("--threads", "-t", type=int, default=8, help="Concurrent clients for the http driver")
+    p.add_argument("--users", type=int, default=50, help="Seeded users")
+    p.add_argument("--history", type=int, default=200, help="Seeded search history rows per user")
+    p.add_argument("--query-pool", type=int, default=500, help="Distinct symptom queries sent to /predict")
+    p.add_argument("--load-repeats", type=int, default=3, help="Dataset loads timed per format")
+    p.add_argument("--prevalence", type=float, default=0.05, help="Generated symptom prevalence")
+    p.add_argument("--seed", type=int, default=42, help="Seed for datasets, database and request mix")
+    p.add_argument("--gen-workers", type=int, default=0, help="Dataset generator processes (0 = one per CPU)")
+    p.add_argument("--workdir", default=None, help="Keep datasets here and reuse them across runs")
+    p.add_argument("--keep", action="store_true", help="Don't delete the temporary work directory")
+    p.add_argument("--out", "-o", default="bench_results.json", help="Where to write the results JSON")
+    p.add_argument("--results", default=None, help="Skip running; check/compare this results JSON instead")
+    p.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    p.add_argument("--max-regression", type=float, default=0.25,
+                   help="With --compare: allowed relative loss in p95, throughput and peak RSS")
+    p.add_argument("--threshold", action="append", default=[], metavar="[ENDPOINT.]METRIC=VALUE",
+                   help=f"Fail when exceeded; metrics: {', '.join(MAX_METRICS + MIN_METRICS)} (throughput is a minimum)")
+    p.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        sys.exit(0)
+
+    if args.results:
+        with open(args.results) as f: report = json.load(f)
+        print(HEADER); print("\n".join(format_row(r) for r in report["results"]))
+    else:
+        print(HEADER)
+        report = run_suite(args)
+        with open(args.out, "w") as f: json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    failures = check_thresholds(report["results"], args.threshold)
+    if args.compare:
+        with open(args.compare) as f: failures += compare(json.load(f), report, args.max_regression)
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compact on-disk dataset format, opened with np.memmap.
+
+A `<name>.symds` directory holds:
+  symptoms.npy  uint8 (rows x symptoms), 0/1 per cell
+  bits.npy      uint8 (symptoms x ceil(rows / 8)), the same matrix bit-packed per symptom
+  labels.npy    int32 disease code per row, -1 when missing
+  meta.json     column names, symptom names, label column, disease names, row count, source CSV stat
+
+Arrays are opened read-only with mmap_mode="r", so loading is near-instant and every
+worker process shares the same page-cached copy. Files are written under temporary
+names and renamed into place with meta.json last; readers that already mapped the
+old files keep them until they reopen.
+
+Usage examples:
+  python3 binary_dataset.py data.csv                  # writes data.symds next to it
+  python3 binary_dataset.py data.csv -o /srv/data.symds
+  python3 binary_dataset.py --info data.symds
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset_store import CHUNK_ROWS, DatasetSnapshot, csv_blocks, csv_layout
+
+FORMAT_VERSION = 1
+SUFFIX = ".symds"
+PACK_COLUMNS = 256  # symptoms packed per pass when building bits.npy
+
+
+def sidecar_path(csv_path) -> str:
+    return os.path.splitext(csv_path)[0] + SUFFIX
+
+
+def read_meta(path):
+    with open(os.path.join(path, "meta.json")) as f: return json.load(f)
+
+
+def is_fresh(path, csv_path) -> bool:
+    """True when `path` holds a conversion of `csv_path` as it is now."""
+    try:
+        meta, st = read_meta(path), os.stat(csv_path)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == FORMAT_VERSION and (meta.get("source_mtime_ns"), meta.get("source_size")) == \
+        (st.st_mtime_ns, st.st_size)
+
+
+class Writer:
+    """Build a .symds directory block by block: append(matrix block, label codes), then close(...).
+
+    Blocks are bit-packed as they arrive while every block so far is a multiple of 8 rows;
+    otherwise bits.npy is packed from the finished matrix in close().
+    """
+
+    def __init__(self, out, symptoms, rows):
+        if not rows: raise ValueError("a .symds dataset needs at least one row")
+        self.out, self.symptoms, self.rows, self.at = out, list(symptoms), rows, 0
+        os.makedirs(out, exist_ok=True)
+        self.matrix = np.lib.format.open_memmap(self._tmp("symptoms.npy"), mode="w+", dtype=np.uint8,
+                                                shape=(rows, len(self.symptoms)))
+        self.labels = np.lib.format.open_memmap(self._tmp("labels.npy"), mode="w+", dtype=np.int32, shape=(rows,))
+        self.bits = np.lib.format.open_memmap(self._tmp("bits.npy"), mode="w+", dtype=np.uint8,
+                                              shape=(len(self.symptoms), (rows + 7) // 8))
+        self.aligned = True
+
+    def _tmp(self, name):
+        return os.path.join(self.out, f".{name}.tmp")
+
+    def append(self, block, codes):
+        at, n = self.at, len(block)
+        self.matrix[at:at + n] = block
+        self.labels[at:at + n] = codes
+        if self.aligned:
+            self.bits[:, at // 8:(at + n + 7) // 8] = np.packbits(np.asarray(block, dtype=np.uint8).T, axis=1)
+            self.aligned = n % 8 == 0
+        self.at += n
+
+    def close(self, columns, label, diseases, source=None) -> str:
+        """Pack what is left, write meta.json and move everything into place; `source` is the CSV it mirrors."""
+        if self.at != self.rows: raise ValueError(f"wrote {self.at} of {self.rows} rows")
+        if not self.aligned:
+            for j in range(0, len(self.symptoms), PACK_COLUMNS):
+                self.bits[j:j + PACK_COLUMNS] = np.packbits(self.matrix[:, j:j + PACK_COLUMNS].T, axis=1)
+        for arr in (self.matrix, self.labels, self.bits): arr.flush()
+        self.matrix = self.labels = self.bits = None
+        meta = dict(format=FORMAT_VERSION, columns=list(columns), symptoms=self.symptoms, label=label,
+                    diseases=list(diseases), rows=self.rows, source=None, source_mtime_ns=None, source_size=None)
+        if source:
+            st = os.stat(source)
+            meta.update(source=os.path.abspath(source), source_mtime_ns=st.st_mtime_ns, source_size=st.st_size)
+        with open(self._tmp("meta.json"), "w") as f: json.dump(meta, f)
+        for name in ("symptoms.npy", "labels.npy", "bits.npy", "meta.json"):
+            os.replace(self._tmp(name), os.path.join(self.out, name))
+        return self.out
+
+
+def convert(csv_path, out=None, chunk_rows=CHUNK_ROWS) -> str:
+    """Convert `csv_path` into a .symds directory in two streaming passes; returns its path."""
+    out = out or sidecar_path(csv_path)
+    columns, symptoms, label = csv_layout(csv_path)
+    rows = sum(len(c) for c in pd.read_csv(csv_path, usecols=[0], chunksize=chunk_rows * 5))
+    if not rows: raise ValueError(f"{csv_path} has no rows")
+    writer, names = Writer(out, symptoms, rows), {}
+    for block, codes in csv_blocks(csv_path, symptoms, label, names, chunk_rows):
+        writer.append(block, codes)
+    return writer.close(columns, label, list(names), source=csv_path)
+
+
+def open_arrays(path):
+    """(meta, symptoms, labels, bits) with every array memory-mapped read-only."""
+    meta = read_meta(path)
+    load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+    return meta, load("symptoms.npy"), load("labels.npy"), load("bits.npy")
+
+
+def load_snapshot(path, signature=None) -> DatasetSnapshot:
+    meta, matrix, labels, bits = open_arrays(path)
+    return DatasetSnapshot(path, meta["columns"], meta["symptoms"], matrix, labels, meta["diseases"],
+                           signature, bits=bits)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Convert a symptom CSV into the memory-mapped .symds format")
+    p.add_argument("csv", nargs="?", help="Source CSV")
+    p.add_argument("--out", "-o", default=None, help=f"Output directory (default: <csv stem>{SUFFIX})")
+    p.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="CSV rows parsed per chunk")
+    p.add_argument("--info", metavar="DIR", help="Print the metadata of an existing .symds directory")
+    args = p.parse_args()
+
+    if args.info:
+        meta = read_meta(args.info)
+        print(f"{args.info}: {meta['rows']} rows x {len(meta['symptoms'])} symptoms, "
+              f"{len(meta['diseases'])} diseases, from {meta['source'] or 'generator'}")
+    elif args.csv:
+        out = convert(args.csv, args.out, args.chunksize)
+        meta = read_meta(out)
+        print(f"Wrote {meta['rows']} rows x {len(meta['symptoms'])} symptoms to {out}")
+    else:
+        p.error("give a CSV to convert or --info DIR")
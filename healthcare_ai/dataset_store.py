@@ -0,0 +1,238 @@
+"""
+In-memory symptom dataset store.
+
+The first usable CSV among a list of candidates is parsed once into a
+`DatasetSnapshot`: the symptom columns become a compact uint8 matrix
+(rows x symptoms) and the disease column an integer-coded vector.
+A background watcher polls the candidates' mtime/size and, when they
+change, builds a fresh snapshot and swaps it in atomically, so requests
+always read a consistent snapshot and never wait on a reload.
+
+Each snapshot also keeps one bit-packed row set per symptom, so "rows that
+have all of these symptoms" is an AND over a few byte arrays followed by a
+popcount and a bincount over the disease codes. Aggregate statistics
+(symptom_stats.py) are built by the store before a snapshot goes live.
+"""
+import logging
+import os
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from symptom_resolver import SymptomResolver
+from symptom_stats import SymptomStats
+
+log = logging.getLogger(__name__)
+
+LABEL_COLUMNS = ("Disease", "disease", "prognosis")
+EXCLUDED_LABELS = ("no disease", "none", "nan", "no")
+TRUTHY = ("1", "true", "yes", "y")
+CHUNK_ROWS = 20000
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+MatchResult = namedtuple("MatchResult", "total ranked matched")
+
+
+def binarize(col: pd.Series) -> np.ndarray:
+    """Map a column to 0/1: numbers by truncated value, anything else by TRUTHY spelling."""
+    num = pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+    out = np.trunc(num) != 0
+    bad = np.isnan(num)
+    if bad.any():
+        out[bad] = col[bad].astype(str).str.strip().str.lower().isin(TRUTHY).to_numpy()
+    return out.astype(np.uint8)
+
+
+def csv_layout(path):
+    """(all columns, symptom columns, label column or None) from the CSV header."""
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    label = next((c for c in LABEL_COLUMNS if c in columns), None)
+    return columns, [c for c in columns if c not in LABEL_COLUMNS], label
+
+
+def csv_blocks(path, symptoms, label, names, chunk_rows=CHUNK_ROWS):
+    """Yield (uint8 symptom block, int32 disease codes) per chunk; `names` maps disease -> code and grows."""
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        block = np.empty((len(chunk), len(symptoms)), dtype=np.uint8)
+        for j, c in enumerate(symptoms):
+            block[:, j] = binarize(chunk[c])
+        if label is None:
+            yield block, np.full(len(chunk), -1, np.int32)
+            continue
+        local, uniques = pd.factorize(chunk[label].map(str, na_action="ignore"))
+        remap = np.array([names.setdefault(u, len(names)) for u in uniques] + [-1], dtype=np.int32)
+        yield block, remap[local]               # factorize marks NaN as -1, which indexes the trailing -1
+
+
+class DatasetSnapshot:
+    """Immutable view of one loaded dataset file."""
+
+    def __init__(self, path, columns, symptoms, matrix, labels, diseases, signature=None, bits=None):
+        self.path = path
+        self.columns = list(columns)           # every CSV column, in file order
+        self.symptoms = list(symptoms)         # symptom columns backing `matrix`
+        self.matrix = matrix                   # uint8, shape (rows, len(symptoms))
+        self.labels = labels                   # int32 disease codes, -1 for missing
+        self.diseases = list(diseases)         # code -> disease name
+        self.signature = signature
+        self.bits = np.packbits(matrix.T, axis=1) if bits is None else bits   # (len(symptoms), ceil(rows / 8))
+        self.index = {c: i for i, c in enumerate(self.symptoms)}
+        self.resolver = SymptomResolver(self.symptoms)
+        self.valid = np.array([str(d).strip().lower() not in EXCLUDED_LABELS for d in self.diseases], dtype=bool)
+        # missing (-1) and excluded labels folded into one trailing "sink" code for bincount
+        keep = np.append(self.valid, False)[labels]
+        self.codes = np.where(keep, labels, len(self.diseases)).astype(np.intp)
+        self.version = zlib.crc32(repr((path, signature)).encode())
+        self._stats = None
+
+    @property
+    def stats(self) -> SymptomStats:
+        """Per-disease symptom counts, priors and co-occurrence, computed on first use."""
+        if self._stats is None: self._stats = SymptomStats.from_snapshot(self)
+        return self._stats
+
+    @property
+    def rows(self) -> int:
+        return int(self.matrix.shape[0])
+
+    @property
+    def empty(self) -> bool:
+        return not self.columns
+
+    def match(self, columns) -> MatchResult:
+        """Count diseases over the rows that contain every symptom in `columns`.
+
+        `ranked` is [(disease, count)] by count, ties broken by first matching row;
+        `matched` lists the same diseases in first-row order. Rows with a missing or
+        excluded label still count towards `total`. No columns matches every row.
+        """
+        if columns:
+            idx = [self.index[c] for c in columns]
+            acc = self.bits[idx[0]].copy()
+            for i in idx[1:]:
+                np.bitwise_and(acc, self.bits[i], out=acc)
+            total = int(POPCOUNT[acc].sum(dtype=np.int64))
+            if not total: return MatchResult(0, [], [])
+            codes = self.codes[np.flatnonzero(np.unpackbits(acc, count=self.rows).view(bool))]
+        else:
+            total, codes = self.rows, self.codes
+        sink = len(self.diseases)
+        counts = np.bincount(codes, minlength=sink + 1)
+        present = np.flatnonzero(counts[:sink])
+        if not present.size: return MatchResult(total, [], [])
+        # First matching row per disease, for Counter-style tie order. Every disease
+        # almost always shows up early, so grow a prefix instead of sorting all codes.
+        first, n = np.full(sink + 1, codes.size), 256
+        while True:
+            seen, at = np.unique(codes[:n], return_index=True)
+            first[seen] = np.minimum(first[seen], at)
+            if n >= codes.size or (first[present] < codes.size).all(): break
+            n *= 4
+        by_first = present[np.argsort(first[present], kind="stable")]
+        ranked = by_first[np.argsort(-counts[by_first], kind="stable")]
+        return MatchResult(total, [(self.diseases[c], int(counts[c])) for c in ranked],
+                           [self.diseases[c] for c in by_first])
+
+    @classmethod
+    def blank(cls, signature=None):
+        return cls(None, [], [], np.zeros((0, 0), np.uint8), np.zeros(0, np.int32), [], signature)
+
+    @classmethod
+    def from_csv(cls, path, signature=None, chunk_rows=CHUNK_ROWS):
+        """Stream `path` in chunks so the raw text frame is never fully materialised."""
+        columns, symptoms, label = csv_layout(path)
+        names, blocks, codes = {}, [], []
+        for block, code in csv_blocks(path, symptoms, label, names, chunk_rows):
+            blocks.append(block); codes.append(code)
+        matrix = np.concatenate(blocks) if blocks else np.zeros((0, len(symptoms)), np.uint8)
+        labels = np.concatenate(codes) if codes else np.zeros(0, np.int32)
+        return cls(path, columns, symptoms, np.ascontiguousarray(matrix), labels, list(names), signature)
+
+
+class DatasetStore:
+    """Holds the current snapshot and reloads it when the source files change.
+
+    binary_dataset is imported lazily because it builds on this module.
+    """
+
+    def __init__(self, candidates, accept=None, interval=5.0):
+        self.candidates = list(candidates)
+        self.accept = accept or (lambda columns: True)
+        self.interval = interval
+        self.listeners = []                    # called with the new snapshot after each reload
+        self._snapshot = DatasetSnapshot.blank()
+        self._failed = None                    # signature whose rebuild failed; not retried until files change
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self) -> DatasetSnapshot:
+        return self._snapshot
+
+    @staticmethod
+    def _stat(path):
+        try: st = os.stat(path); return (path, st.st_mtime_ns, st.st_size)
+        except OSError: return (path, None, None)
+
+    def signature(self):
+        import binary_dataset
+        sig = []
+        for f in self.candidates:
+            binary = f if os.path.isdir(f) else binary_dataset.sidecar_path(f)
+            sig += [self._stat(f), self._stat(os.path.join(binary, "meta.json"))]
+        return tuple(sig)
+
+    def _build(self, signature):
+        """First acceptable candidate; a .symds directory, or a CSV's up-to-date .symds sidecar, is memory-mapped.
+
+        A blank snapshot when no candidate exists (or none is accepted); raises when an existing
+        candidate can't be read, e.g. while it is being rewritten.
+        """
+        import binary_dataset
+        for f in self.candidates:
+            if not os.path.exists(f): continue
+            binary = f if os.path.isdir(f) else binary_dataset.sidecar_path(f)
+            if os.path.isdir(f) or binary_dataset.is_fresh(binary, f):
+                if not self.accept(binary_dataset.read_meta(binary)["columns"]): continue
+                return binary_dataset.load_snapshot(binary, signature)
+            if not self.accept(csv_layout(f)[0]): continue
+            return DatasetSnapshot.from_csv(f, signature)
+        return DatasetSnapshot.blank(signature)
+
+    def reload(self, force=False) -> bool:
+        """Rebuild the snapshot if the candidates changed; returns True when a new one was swapped in."""
+        with self._reload_lock:
+            sig = self.signature()
+            if not force and sig in (self._snapshot.signature, self._failed): return False
+            try: snap = self._build(sig)
+            except Exception:
+                # Keep serving the current snapshot; the next change to the files retries.
+                log.exception("Dataset reload failed; keeping the current %d-row snapshot", self._snapshot.rows)
+                self._failed = sig
+                return False
+            self._failed = None
+            try: snap.stats                          # precompute before requests can see the snapshot
+            except Exception: pass
+            self._snapshot = snap                    # one reference swap: readers see old or new, never partial
+        for fn in list(self.listeners):
+            try: fn(snap)
+            except Exception: pass
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try: self.reload()
+            except Exception: pass
+
+    def start_watcher(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watcher(self):
+        self._stop.set()
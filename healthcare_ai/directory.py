@@ -0,0 +1,98 @@
+"""
+In-process reference directory for the prediction hot path.
+
+Maps disease -> specialty -> recommended doctors and disease -> remedies.
+The fuzzy disease-name matching that used to run on every request happens
+once per name (eagerly for every label the dataset/model can return,
+lazily for anything else), and the doctor roster is read from the database
+in a single query that is only repeated after `invalidate()`.
+
+Changes made by other processes (other workers, the CLI, database tools)
+are noticed through `load_version`: a cheap read of a counter that is
+bumped whenever the doctors change, done at most every `check_every`
+seconds; a new value invalidates the roster.
+"""
+import threading
+import time
+from collections import namedtuple
+
+DoctorCard = namedtuple("DoctorCard", "id name specialty hospital available")
+
+
+def fuzzy_get(table, name):
+    """table[name], else the first entry whose key and `name` contain one another."""
+    if name in table: return table[name]
+    low = name.lower()
+    return next((v for k, v in table.items() if k.lower() in low or low in k.lower()), None)
+
+
+class ReferenceDirectory:
+    def __init__(self, specialties, remedies, generic, load_doctors,
+                 default_specialty="General Physician", per_specialty=2, load_version=None, check_every=5.0):
+        self.specialties = specialties
+        self.remedy_table = remedies
+        self.generic = generic
+        self.load_doctors = load_doctors        # () -> iterable of DoctorCard, ordered by id
+        self.default_specialty = default_specialty
+        self.per_specialty = per_specialty
+        self.load_version = load_version        # () -> roster version shared by every process, or None
+        self.check_every = check_every
+        self._spec, self._rem = {}, {}
+        self._doctors = None                    # specialty -> [DoctorCard], None when stale
+        self._generation = 0
+        self._version, self._next_check = None, 0.0
+        self._lock = threading.Lock()
+
+    def warm(self, diseases):
+        """Resolve specialty and remedies for every name up front."""
+        for d in diseases:
+            self.specialty(str(d)); self.remedies(str(d))
+
+    def specialty(self, disease):
+        spec = self._spec.get(disease)
+        if spec is None:
+            spec = self._spec[disease] = (self.specialties.get(disease)
+                or next((v for k, v in self.specialties.items() if k.lower() in disease.lower()), None)
+                or self.default_specialty)
+        return spec
+
+    def remedies(self, disease):
+        rem = self._rem.get(disease)
+        if rem is None:
+            rem = self._rem[disease] = fuzzy_get(self.remedy_table, disease) or self.generic
+        return rem
+
+    def invalidate(self, *_):
+        self._generation += 1
+        self._doctors = None
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now < self._next_check: return
+        self._next_check = now + self.check_every   # set first, so concurrent requests don't all query
+        try: version = self.load_version()
+        except Exception: return                  # keep serving the current roster
+        if version != self._version:
+            self._version = version
+            self.invalidate()
+
+    def _roster(self):
+        if self.load_version: self._check_version()
+        roster = self._doctors
+        if roster is not None: return roster
+        with self._lock:
+            if self._doctors is not None: return self._doctors
+            gen = self._generation
+            by_spec, anyone = {}, {}
+            for c in self.load_doctors():
+                anyone.setdefault(c.specialty, []).append(c)
+                if c.available: by_spec.setdefault(c.specialty, []).append(c)
+            n = self.per_specialty
+            roster = {"": anyone.get(self.default_specialty, [])[:n], **{s: v[:n] for s, v in by_spec.items()}}
+            if gen == self._generation: self._doctors = roster   # an invalidate() mid-load keeps it stale
+            return roster
+
+    def doctors(self, specialty):
+        """Available doctors for `specialty`, else the first general physicians (available or not)."""
+        roster = self._roster()
+        return roster.get(specialty) or roster[""]
@@ -4,51 +4,130 @@ Generate a synthetic CSV dataset with many symptom columns.
 Usage examples:
   python3 generate_sample_dataset.py --symptoms 1000 --rows 2000 --out sample_large.csv
   python3 generate_sample_dataset.py --symptoms 2000 --rows 500 --diseases Flu,Dengue,Cold
+  python3 generate_sample_dataset.py -s 5000 -r 1000000 -j 8 --signature 12 --format both
+
+Rows are drawn in blocks of --chunk-rows as one Bernoulli matrix per block, each row with
+its own prevalence ~ N(prevalence, 0.03) clipped to [0.001, 0.95]. Every block has its own
+seed spawned from --seed, so the output is identical for any number of --workers.
+
+With --signature N each disease gets N fixed symptoms that its rows report with probability
+--signature-prob on top of the background noise, so the labels are learnable.
+--format symds/both also writes the memory-mapped .symds directory (see binary_dataset.py)
+next to --out; with "both" it is stamped as an up-to-date sidecar of the CSV.
 """
-import csv
 import argparse
-import random
+import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import binary_dataset
 
 DEFAULT_DISEASES = [
     "Flu", "Dengue", "Common Cold", "Migraine", "Fatigue Syndrome",
     "Bronchial Asthma", "Malaria", "Pneumonia", "Allergy", "Typhoid",
     "Hepatitis A", "Muscle Pain", "No Disease"
 ]
+CHUNK_ROWS = 2048     # rows per block; a multiple of 8 so .symds blocks bit-pack in place
+ROW_PREV_SD = 0.03
+NO_SIGNATURE = ("no disease", "none", "no")
 
+_cfg = None           # per-process generation settings, set by _init
 
-def generate(symptoms_count: int, rows: int, out_path: str, diseases, prevalence: float, seed: int, per_disease: int = 0):
-    random.seed(seed)
 
-    symptom_names = [f"symptom_{i:04d}" for i in range(1, symptoms_count + 1)]
+def _init(cfg):
+    global _cfg
+    _cfg = cfg
+
+
+def csv_field(text) -> str:
+    return '"' + text.replace('"', '""') + '"' if any(ch in text for ch in ',"\r\n') else text
 
-    with open(out_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        # header
-        writer.writerow(symptom_names + ["Disease"])
 
-        if per_disease and per_disease > 0:
-            # Balanced generation: exactly `per_disease` rows per disease
-            total = per_disease * len(diseases)
-            for disease in diseases:
-                for _ in range(per_disease):
-                    # For realism, vary per-row base symptom probability slightly
-                    row_prev = max(0.001, min(0.95, random.gauss(prevalence, 0.03)))
-                    row = ["1" if random.random() < row_prev else "0" for _ in range(symptoms_count)]
-                    writer.writerow(row + [disease])
-            print(f"Wrote {total} rows x {symptoms_count} symptoms to {out_path} (balanced: {per_disease} per disease)")
-            return
+def signatures(seq, diseases, symptoms_count, size):
+    """(len(diseases), size) column indices: the symptoms each disease tends to report."""
+    size = min(size, symptoms_count)
+    rng = np.random.default_rng(seq)
+    return np.array([rng.choice(symptoms_count, size, replace=False) for _ in diseases],
+                    dtype=np.intp).reshape(len(diseases), size)
 
-        for r in range(rows):
-            # For realism, vary per-row base symptom probability slightly
-            row_prev = max(0.001, min(0.95, random.gauss(prevalence, 0.03)))
-            row = ["1" if random.random() < row_prev else "0" for _ in range(symptoms_count)]
 
-            # Simple disease assignment: pick randomly (could be made rule-based)
-            disease = random.choice(diseases)
-            writer.writerow(row + [disease])
+def make_block(task):
+    """(CSV bytes or None, uint8 0/1 matrix, int32 disease codes) for rows [start, start + n)."""
+    seq, start, n = task
+    cfg = _cfg
+    rng = np.random.default_rng(seq)
+    if cfg["per_disease"]:
+        codes = (np.arange(start, start + n) // cfg["per_disease"]).astype(np.int32)
+    else:
+        codes = rng.integers(0, len(cfg["tails"]), n, dtype=np.int32)
+    row_prev = np.clip(rng.normal(cfg["prevalence"], ROW_PREV_SD, n), 0.001, 0.95).astype(np.float32)
+    block = rng.random((n, cfg["symptoms"]), dtype=np.float32) < row_prev[:, None]
+    sig = cfg["signatures"]
+    if sig.shape[1]:
+        cols = sig[codes]
+        block[np.arange(n)[:, None], cols] |= rng.random(cols.shape, dtype=np.float32) < cfg["sig_prob"][codes, None]
+    block = block.view(np.uint8)
+    if not cfg["csv"]: return None, block, codes
+    width = 2 * cfg["symptoms"]
+    text = np.full((n, width), ord(","), dtype=np.uint8)   # "d,d,...,d," then the label
+    text[:, 0::2] = block + ord("0")
+    body, tails = memoryview(text.tobytes()), cfg["tails"]
+    return b"".join(x for i, c in enumerate(codes.tolist()) for x in (body[i * width:(i + 1) * width], tails[c])), \
+        block, codes
+
+
+def _blocks(tasks, cfg, workers):
+    """make_block over `tasks` in order, with at most 2 * workers blocks in flight."""
+    if workers <= 1:
+        _init(cfg)
+        yield from map(make_block, tasks)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(cfg,)) as ex:
+        pending = deque()
+        for t in tasks:
+            pending.append(ex.submit(make_block, t))
+            if len(pending) >= 2 * workers: yield pending.popleft().result()
+        while pending: yield pending.popleft().result()
+
+
+def generate(symptoms_count: int, rows: int, out_path: str, diseases, prevalence: float, seed: int, per_disease: int = 0,
+             signature: int = 0, signature_prob: float = 0.6, workers: int = 0, chunk_rows: int = CHUNK_ROWS,
+             fmt: str = "csv"):
+    symptom_names = [f"symptom_{i:04d}" for i in range(1, symptoms_count + 1)]
+    # Balanced generation: exactly `per_disease` rows per disease, in disease order
+    total = per_disease * len(diseases) if per_disease and per_disease > 0 else rows
+    chunk_rows = max(8, chunk_rows // 8 * 8)
+    sig_seq, block_seq = np.random.SeedSequence(seed).spawn(2)
+    starts = range(0, total, chunk_rows)
+    tasks = [(s, start, min(chunk_rows, total - start)) for s, start in zip(block_seq.spawn(len(starts)), starts)]
+    cfg = dict(symptoms=symptoms_count, prevalence=prevalence, per_disease=per_disease if per_disease > 0 else 0,
+               csv=fmt in ("csv", "both"), tails=[(csv_field(d) + "\n").encode() for d in diseases],
+               signatures=signatures(sig_seq, diseases, symptoms_count, signature),
+               sig_prob=np.array([0.0 if d.lower() in NO_SIGNATURE else signature_prob for d in diseases],
+                                 dtype=np.float32))
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    f = open(out_path, "wb") if cfg["csv"] else None
+    binary = binary_dataset.Writer(binary_dataset.sidecar_path(out_path), symptom_names, total) \
+        if fmt in ("symds", "both") and total else None
+    try:
+        if f: f.write((",".join(symptom_names + ["Disease"]) + "\n").encode())
+        for text, block, codes in _blocks(tasks, cfg, workers):
+            if f: f.write(text)
+            if binary: binary.append(block, codes)
+    finally:
+        if f: f.close()
+    if binary:
+        binary.close(symptom_names + ["Disease"], "Disease", diseases, source=out_path if f else None)
 
-    print(f"Wrote {rows} rows x {symptoms_count} symptoms to {out_path}")
+    where = " and ".join(p for p, on in ((out_path, f), (binary and binary.out, binary)) if on)
+    if per_disease and per_disease > 0:
+        print(f"Wrote {total} rows x {symptoms_count} symptoms to {where} (balanced: {per_disease} per disease)")
+    else:
+        print(f"Wrote {rows} rows x {symptoms_count} symptoms to {where}")
 
 
 if __name__ == "__main__":
@@ -60,6 +139,12 @@ if __name__ == "__main__":
     p.add_argument("--prevalence", type=float, default=0.05, help="Base prevalence for symptoms (0-1)")
     p.add_argument("--seed", type=int, default=42, help="Random seed for reproducibility")
     p.add_argument("--per-disease", "-p", type=int, default=0, help="If set, generate this many examples per disease (balanced)")
+    p.add_argument("--signature", type=int, default=0, help="Symptoms characteristic of each disease (0 = pure noise)")
+    p.add_argument("--signature-prob", type=float, default=0.6, help="Chance a row reports each of its disease's signature symptoms")
+    p.add_argument("--workers", "-j", type=int, default=0, help="Generator processes (0 = one per CPU)")
+    p.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows drawn per block")
+    p.add_argument("--format", choices=("csv", "symds", "both"), default="csv",
+                   help="Write the CSV, the .symds binary next to it, or both")
 
     args = p.parse_args()
 
@@ -68,4 +153,6 @@ if __name__ == "__main__":
         print("No diseases provided. Exiting.")
         sys.exit(1)
 
-    generate(args.symptoms, args.rows, args.out, diseases, args.prevalence, args.seed, per_disease=args.per_disease)
+    generate(args.symptoms, args.rows, args.out, diseases, args.prevalence, args.seed, per_disease=args.per_disease,
+             signature=args.signature, signature_prob=args.signature_prob, workers=args.workers,
+             chunk_rows=args.chunk_rows, fmt=args.format)
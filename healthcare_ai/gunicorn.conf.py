@@ -0,0 +1,45 @@
+"""
+Gunicorn settings:  gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app; wsgi.py loads the served
+model too) so the model and dataset arrays are shared copy-on-write by every
+worker. gc.freeze() before each fork keeps the collector from touching, and
+so copying, those preloaded objects.
+Each worker then drops any inherited database connections and starts its own
+dataset watcher and history writer threads.
+
+Workers share their request metrics through METRICS_DIR (a fresh temporary
+directory unless set), so /metrics reports totals over all of them.
+"""
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+chdir = os.path.dirname(os.path.abspath(__file__))
+preload_app = True
+accesslog = "-"
+
+if not os.environ.get("METRICS_DIR"):
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="symptocare-metrics-")
+
+
+def on_starting(server):
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)                     # a previous run's workers
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import app, db, start_background
+    with app.app_context():
+        db.engine.dispose(close=False)      # leave the master's connections to the master
+    start_background()
@@ -0,0 +1,106 @@
+"""
+Incremental CSV / NDJSON / Parquet encoding of search-history rows.
+
+`encode()` turns an iterable of row batches (as produced by a streaming,
+server-side cursor) into an iterable of byte chunks, one or more per batch,
+so an export never holds more than one batch in memory whether it goes to
+an HTTP response or a file:
+
+  csv      header line, then the columns as stored (`alternatives` and
+           `resolved` stay JSON text)
+  ndjson   one object per row; JSON text columns are decoded into lists
+  parquet  one row group per batch; needs the optional `pyarrow` package
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only the parquet format needs it
+    pa = pq = None
+
+FORMATS = ("csv", "ndjson", "parquet")
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+JSON_COLUMNS = ("alternatives", "resolved")
+
+
+def available(fmt) -> bool:
+    return fmt in FORMATS and (fmt != "parquet" or pa is not None)
+
+
+def _plain(v):
+    return v.isoformat() if isinstance(v, (datetime, date)) else v
+
+
+def _csv(batches, columns):
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(columns)
+    for batch in batches:
+        w.writerows([_plain(v) for v in row] for row in batch)
+        yield buf.getvalue().encode()
+        buf.seek(0); buf.truncate()
+    if buf.tell(): yield buf.getvalue().encode()
+
+
+def _ndjson(batches, columns):
+    decode = [c in JSON_COLUMNS for c in columns]
+    for batch in batches:
+        lines = []
+        for row in batch:
+            obj = {}
+            for c, d, v in zip(columns, decode, row):
+                if d and v:
+                    try: v = json.loads(v)
+                    except ValueError: pass
+                obj[c] = _plain(v)
+            lines.append(json.dumps(obj, ensure_ascii=False))
+        if lines: yield ("\n".join(lines) + "\n").encode()
+
+
+class _Chunks:
+    """Write-only file object whose contents are handed out (and forgotten) by take()."""
+    def __init__(self): self._parts, self.closed = [], False
+    def write(self, b): self._parts.append(bytes(b)); return len(b)
+    def flush(self): pass
+    def close(self): self.closed = True
+    def take(self):
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+
+def _parquet(batches, columns, types):
+    sink = _Chunks()
+    schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            if not batch: continue
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in batch], schema=schema))
+            chunk = sink.take()
+            if chunk: yield chunk
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def encode(batches, columns, fmt, types=None):
+    """Byte chunks of `batches` (iterables of row tuples in `columns` order) in `fmt`.
+
+    `types` maps column names to pyarrow types for parquet (others are strings).
+    """
+    if not available(fmt):
+        raise ValueError(f"unsupported export format {fmt!r}" + (" (install pyarrow)" if fmt == "parquet" else ""))
+    if fmt == "csv": return _csv(batches, columns)
+    if fmt == "ndjson": return _ndjson(batches, columns)
+    return _parquet(batches, columns, types or {})
+
+
+def arrow_types(names):
+    """pyarrow types for the search_history columns the export writes, keyed by column name."""
+    if pa is None: return {}
+    known = {"id": pa.int64(), "user_id": pa.int64(), "confidence": pa.float64(), "timestamp": pa.timestamp("us")}
+    return {n: known[n] for n in names if n in known}
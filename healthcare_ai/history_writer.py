@@ -0,0 +1,77 @@
+"""
+Write-behind queue for search history rows.
+
+Requests hand finished rows to `submit()` and return immediately; a
+background thread groups them and hands each group to `write(rows)` in
+one transaction, either when `batch_size` rows are waiting or
+`flush_interval` seconds after the first of them arrived. A full queue
+makes `submit()` wait up to `put_timeout` seconds before giving up and
+counting the row as dropped. `stop()` (registered with atexit) drains
+whatever is still queued.
+"""
+import atexit
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class HistoryWriter:
+    def __init__(self, write, max_queue=10000, batch_size=200, flush_interval=1.0, put_timeout=0.05):
+        self.write = write                      # (list of row dicts) -> None, raises on failure
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._q = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.enqueued = self.written = self.dropped = self.failed = self.batches = 0
+
+    def submit(self, row) -> bool:
+        """Queue one row; False if the queue stayed full for `put_timeout` and the row was dropped."""
+        try: self._q.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock: self.dropped += 1
+            return False
+        with self._lock: self.enqueued += 1
+        return True
+
+    def _flush(self, batch):
+        if not batch: return
+        try:
+            self.write(batch)
+            with self._lock: self.written += len(batch); self.batches += 1
+        except Exception:
+            with self._lock: self.failed += len(batch)
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is _STOP: return
+            batch, deadline = [item], time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try: item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty: break
+                if item is _STOP:
+                    self._flush(batch); return
+                batch.append(item)
+            self._flush(batch)
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return self
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=10.0):
+        """Flush everything queued so far and stop the worker thread."""
+        if not (self._thread and self._thread.is_alive()): return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(queued=self._q.qsize(), enqueued=self.enqueued, written=self.written,
+                        dropped=self.dropped, failed=self.failed, batches=self.batches)
@@ -0,0 +1,96 @@
+"""
+Model-backed disease prediction.
+
+Wraps the RandomForest saved by train_model.py together with the
+LabelEncoder it was trained with, turns resolved symptom column names into
+feature vectors, and scores any number of symptom sets with one
+vectorised predict_proba call.
+
+Next to the pickle, `disease_model.meta.json` records its feature names and
+classes keyed by the size and CRC of the pickle and encoder, so the app can
+learn them without unpickling the model.
+"""
+import json
+import os
+import zlib
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from dataset_store import EXCLUDED_LABELS
+from symptom_resolver import SymptomResolver
+
+
+def meta_path(model_path):
+    return os.path.splitext(model_path)[0] + ".meta.json"
+
+
+def file_key(path):
+    """[size, crc32] of a file, or None when it is missing; unlike mtimes, survives a fresh checkout."""
+    try:
+        crc = 0
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""): crc = zlib.crc32(block, crc)
+        return [os.path.getsize(path), crc]
+    except OSError:
+        return None
+
+
+def read_meta(model_path, encoder_path=None):
+    """(feature names, classes) from the sidecar of `model_path`, or None when it is missing or stale."""
+    try:
+        with open(meta_path(model_path)) as f: meta = json.load(f)
+        if meta["model"] != file_key(model_path) or meta.get("encoder") != file_key(encoder_path or ""): return None
+        return meta["feature_names"], meta["classes"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class DiseaseModel:
+    def __init__(self, model, encoder=None, version=None):
+        self.model = model
+        self.encoder = encoder
+        self.version = version
+        self.feature_names = [str(c) for c in getattr(model, "feature_names_in_", [])]
+        self.index = {c: i for i, c in enumerate(self.feature_names)}
+        self.resolver = SymptomResolver(self.feature_names)
+        classes = model.classes_
+        if encoder is not None and np.issubdtype(np.asarray(classes).dtype, np.integer):
+            classes = encoder.inverse_transform(classes)
+        self.classes = [str(c) for c in classes]
+        self.keep = np.array([c.strip().lower() not in EXCLUDED_LABELS for c in self.classes], dtype=bool)
+
+    @classmethod
+    def load(cls, model_path, encoder_path=None):
+        """Load a pickled model (and encoder, if present); None when the model is missing or unreadable."""
+        try: model = joblib.load(model_path)
+        except Exception: return None
+        encoder = None
+        if encoder_path and os.path.exists(encoder_path):
+            try: encoder = joblib.load(encoder_path)
+            except Exception: pass
+        return cls(model, encoder, version=int(os.stat(model_path).st_mtime_ns))
+
+    def write_meta(self, model_path, encoder_path=None):
+        """Write the read_meta() sidecar for the files this model was loaded from or saved to."""
+        meta = dict(model=file_key(model_path), encoder=file_key(encoder_path or ""),
+                    feature_names=self.feature_names, classes=self.classes)
+        with open(meta_path(model_path), "w") as f: json.dump(meta, f, indent=2)
+
+    def features(self, symptom_sets) -> np.ndarray:
+        X = np.zeros((len(symptom_sets), len(self.feature_names)), dtype=np.uint8)
+        for row, cols in enumerate(symptom_sets):
+            X[row, [self.index[c] for c in cols if c in self.index]] = 1
+        return X
+
+    def predict(self, symptom_sets, top=20):
+        """[(disease, probability)] per symptom set, best first, zero-probability classes dropped."""
+        if not len(symptom_sets): return []
+        X = self.features(symptom_sets)
+        if self.feature_names and hasattr(self.model, "feature_names_in_"):
+            X = pd.DataFrame(X, columns=self.model.feature_names_in_)
+        proba = self.model.predict_proba(X)
+        proba[:, ~self.keep] = 0
+        order = np.argsort(-proba, axis=1, kind="stable")[:, :top]
+        return [[(self.classes[c], float(p[c])) for c in o if p[c] > 0] for p, o in zip(proba, order)]
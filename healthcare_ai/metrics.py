@@ -0,0 +1,230 @@
+"""
+In-process request metrics, rendered in the Prometheus text format.
+
+`Histogram` and `Counter` keep cumulative values per label set. `Metrics`
+bundles the ones the app records:
+
+  - request latency per endpoint and a request counter by status
+  - `span(endpoint, stage)` timings around stages of a request
+  - SQL statements through engine before/after_cursor_execute events,
+    timed per statement kind and counted per request
+  - gauges/counters read from other components' `stats()` at scrape time
+
+Recording is a dict lookup and a few additions under a lock, so it stays
+on in production.
+
+Series live in the process that recorded them. Under a pre-fork server,
+`share(directory)` makes each worker write its series to <directory>/<pid>.json
+every second or so; `render()` then sums the histograms and counters of every
+file (workers that have exited included, so totals never go backwards) and
+reports the component gauges of live workers with a `pid` label.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values) -> str:
+    if not names: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series = {}                       # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None: s = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1; s[-1] += value
+
+    def snapshot(self):
+        with self._lock: return {k: list(v) for k, v in self._series.items()}
+
+    @staticmethod
+    def add(a, b): return [x + y for x, y in zip(a, b)] if a else list(b)
+
+    def render(self, series=None):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        if series is None: series = self.snapshot()
+        for values, s in sorted(series.items()):
+            acc = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s[:-1]):
+                acc += n
+                out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), values + (bound,))} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labels, values)} {_num(s[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labels, values)} {acc}")
+        return out
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock: self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock: return dict(self._series)
+
+    @staticmethod
+    def add(a, b): return (a or 0) + b
+
+    def render(self, series=None):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if series is None: series = self.snapshot()
+        out += [f"{self.name}{_labels(self.labels, v)} {_num(n)}" for v, n in sorted(series.items())]
+        return out
+
+
+class Metrics:
+    def __init__(self, prefix="symptocare"):
+        self.prefix = prefix
+        p = prefix + "_"
+        self.request_seconds = Histogram(p + "request_duration_seconds", "Request latency by endpoint.", ("endpoint",))
+        self.requests = Counter(p + "requests_total", "Requests by endpoint, method and status.",
+                                ("endpoint", "method", "status"))
+        self.stage_seconds = Histogram(p + "stage_duration_seconds", "Time spent in each stage of a request.",
+                                       ("endpoint", "stage"))
+        self.query_seconds = Histogram(p + "db_query_duration_seconds", "SQL statement latency by kind.", ("kind",))
+        self.request_queries = Histogram(p + "db_queries_per_request", "SQL statements issued per request.",
+                                         ("endpoint",), COUNT_BUCKETS)
+        self.request_query_seconds = Histogram(p + "db_time_per_request_seconds",
+                                               "Total SQL time per request.", ("endpoint",))
+        self._metrics = [self.request_seconds, self.requests, self.stage_seconds, self.query_seconds,
+                         self.request_queries, self.request_query_seconds]
+        self._sources = []                      # (name, stats callable, counter keys)
+        self._local = threading.local()         # per-thread SQL tally of the request in flight
+        self.share_dir, self.share_interval = None, 1.0
+        self._share_lock = threading.Lock()
+
+    # ── requests ──
+    def start_request(self):
+        self._local.queries, self._local.query_seconds, self._local.active = 0, 0.0, True
+        return time.perf_counter()
+
+    def end_request(self, started, endpoint, method, status):
+        endpoint = endpoint or "unmatched"
+        self.request_seconds.observe(time.perf_counter() - started, endpoint)
+        self.requests.inc(1, endpoint, method, str(status))
+        if getattr(self._local, "active", False):
+            self.request_queries.observe(self._local.queries, endpoint)
+            self.request_query_seconds.observe(self._local.query_seconds, endpoint)
+            self._local.active = False
+
+    @contextmanager
+    def span(self, endpoint, stage):
+        t = time.perf_counter()
+        try: yield
+        finally: self.stage_seconds.observe(time.perf_counter() - t, endpoint, stage)
+
+    # ── SQL ──
+    def instrument_engine(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            dt = time.perf_counter() - conn.info["query_start"].pop()
+            self.query_seconds.observe(dt, statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "")
+            if getattr(self._local, "active", False):
+                self._local.queries += 1; self._local.query_seconds += dt
+
+    # ── scraped components ──
+    def add_source(self, name, stats, counters=()):
+        """Expose `stats()` (a dict of numbers) as <prefix>_<name>_<key>; keys in `counters` become *_total."""
+        self._sources.append((name, stats, frozenset(counters)))
+
+    def _source_values(self):
+        """[(metric, type, value)] read from every source now."""
+        out = []
+        for name, stats, counters in self._sources:
+            try: values = stats()
+            except Exception: continue
+            for key, v in values.items():
+                if isinstance(v, bool) or not isinstance(v, (int, float)): continue
+                metric = f"{self.prefix}_{name}_{key}" + ("_total" if key in counters else "")
+                out.append((metric, "counter" if key in counters else "gauge", v))
+        return out
+
+    @staticmethod
+    def _render_sources(values, pid_label=False):
+        out, typed = [], set()
+        for metric, kind, v, pid in sorted(values, key=lambda r: (r[0], r[3])):
+            if metric not in typed: out.append(f"# TYPE {metric} {kind}"); typed.add(metric)
+            out.append(f"{metric}{_labels(('pid',), (pid,)) if pid_label else ''} {_num(v)}")
+        return out
+
+    # ── several processes ──
+    def share(self, directory, interval=1.0):
+        """Write this process's series to `directory` every `interval` seconds (a daemon thread)."""
+        os.makedirs(directory, exist_ok=True)
+        self.share_dir, self.share_interval = directory, interval
+        threading.Thread(target=self._share_loop, daemon=True, name="metrics-share").start()
+
+    def _share_loop(self):
+        while True:
+            try: self.write_share()
+            except OSError: pass
+            time.sleep(self.share_interval)
+
+    def write_share(self):
+        data = dict(metrics={m.name: [[list(k), v] for k, v in m.snapshot().items()] for m in self._metrics},
+                    sources=self._source_values())
+        path = os.path.join(self.share_dir, f"{os.getpid()}.json")
+        with self._share_lock:
+            with open(path + ".tmp", "w") as f: json.dump(data, f)
+            os.replace(path + ".tmp", path)          # readers see the old file or the new one
+
+    def _merged(self):
+        """(series per metric summed over every process file, [(metric, type, value, pid)] of live ones)."""
+        try: self.write_share()
+        except OSError: pass
+        merged, sources = {m.name: {} for m in self._metrics}, []
+        fresh = time.time() - 3 * self.share_interval
+        for path in glob.glob(os.path.join(self.share_dir, "*.json")):
+            try:
+                with open(path) as f: data = json.load(f)
+                mtime = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            for m in self._metrics:
+                series = merged[m.name]
+                for k, v in data["metrics"].get(m.name, []):
+                    series[tuple(k)] = m.add(series.get(tuple(k)), v)
+            if mtime >= fresh:
+                pid = os.path.splitext(os.path.basename(path))[0]
+                sources += [(metric, kind, v, pid) for metric, kind, v in data["sources"]]
+        return merged, sources
+
+    def render(self) -> str:
+        lines = []
+        if self.share_dir:
+            merged, sources = self._merged()
+            for m in self._metrics: lines += m.render(merged[m.name])
+            lines += self._render_sources(sources, pid_label=True)
+        else:
+            for m in self._metrics: lines += m.render()
+            lines += self._render_sources([(metric, kind, v, None) for metric, kind, v in self._source_values()])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Versioned model artifacts, loaded lazily and swapped without a restart.
+
+A registry directory holds one subdirectory per version plus an ACTIVE file
+naming the version the app serves:
+
+  models/
+    ACTIVE
+    20261016T120000/
+      meta.json           feature names, decoded classes, metrics, training params
+      model.joblib        the fitted estimator
+      label_encoder.joblib
+      compact/            optional flattened forest, memory-mapped (see CompactForest)
+
+`LiveModel` is what the app holds: it reads ACTIVE at most every `interval`
+seconds, loads the model on first use (so importing the app stays cheap), and
+when ACTIVE changes (or, with nothing active, when the fallback pickle is
+rewritten) loads the new model and swaps one reference, so requests already
+running finish on the old model. Feature names and classes come from
+meta.json, or the fallback pickle's sidecar, without loading anything.
+
+The compact format stores every tree of a random forest as flat node arrays
+(float16 leaf probabilities) and scores a batch by walking all trees at once
+with NumPy; loading is a few np.load(mmap_mode="r") calls, and workers share
+the pages.
+
+Usage examples:
+  python3 model_registry.py list
+  python3 model_registry.py import disease_model.pkl --encoder label_encoder.pkl
+  python3 model_registry.py compact 20261016T120000
+  python3 model_registry.py activate 20261016T120000
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from inference import DiseaseModel, read_meta
+
+ACTIVE_FILE = "ACTIVE"
+COMPACT_DIR = "compact"
+COMPACT_ARRAYS = ("left", "right", "feature", "threshold", "leaf", "proba", "roots")
+
+
+class CompactForest:
+    """predict_proba-compatible forest over flat node arrays.
+
+    Node i of the concatenated trees goes to left[i] when x[feature[i]] <= threshold[i],
+    else right[i]; leaves point at themselves, so `depth` steps from the roots always end
+    on a leaf. leaf[i] indexes that leaf's class probabilities in `proba`.
+    """
+
+    def __init__(self, arrays, classes, feature_names, depth):
+        for name in COMPACT_ARRAYS: setattr(self, name, arrays[name])
+        self.classes_ = np.asarray(classes, dtype=object)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.depth = depth
+
+    @classmethod
+    def from_forest(cls, forest, classes):
+        left, right, feature, threshold, leaf, proba, roots, offset, depth = [], [], [], [], [], [], [], 0, 0
+        for est in forest.estimators_:
+            t = est.tree_
+            n = t.node_count
+            is_leaf = t.children_left < 0
+            own = np.arange(offset, offset + n, dtype=np.int32)
+            left.append(np.where(is_leaf, own, t.children_left + offset).astype(np.int32))
+            right.append(np.where(is_leaf, own, t.children_right + offset).astype(np.int32))
+            feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+            threshold.append(np.where(is_leaf, 0, t.threshold).astype(np.float32))
+            ids = np.full(n, -1, dtype=np.int32)
+            ids[is_leaf] = np.arange(int(is_leaf.sum())) + sum(len(p) for p in proba)
+            leaf.append(ids)
+            v = t.value[is_leaf, 0, :]
+            proba.append((v / np.maximum(v.sum(axis=1, keepdims=True), 1e-12)).astype(np.float16))
+            roots.append(offset); offset += n; depth = max(depth, int(t.max_depth))
+        arrays = dict(left=np.concatenate(left), right=np.concatenate(right), feature=np.concatenate(feature),
+                      threshold=np.concatenate(threshold), leaf=np.concatenate(leaf), proba=np.concatenate(proba),
+                      roots=np.asarray(roots, dtype=np.int32))
+        return cls(arrays, classes, getattr(forest, "feature_names_in_", []), depth)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in COMPACT_ARRAYS: np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, classes, feature_names, depth):
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in COMPACT_ARRAYS}
+        return cls(arrays, classes, feature_names, depth)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        node = np.broadcast_to(np.asarray(self.roots), (len(X), len(self.roots))).copy()
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.proba[self.leaf[node]].astype(np.float32).mean(axis=1)
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, version, *parts):
+        return os.path.join(self.root, version, *parts)
+
+    def versions(self):
+        """meta.json of every version, oldest first."""
+        if not os.path.isdir(self.root): return []
+        out = []
+        for name in sorted(os.listdir(self.root)):
+            try: out.append(self.meta(name))
+            except (OSError, ValueError): pass
+        return out
+
+    def meta(self, version):
+        with open(self.path(version, "meta.json")) as f: return json.load(f)
+
+    def active_version(self):
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f: return f.read().strip() or None
+        except OSError:
+            return None
+
+    def activate(self, version):
+        self.meta(version)                                  # must exist
+        tmp = os.path.join(self.root, f".{ACTIVE_FILE}.tmp")
+        with open(tmp, "w") as f: f.write(version + "\n")
+        os.replace(tmp, os.path.join(self.root, ACTIVE_FILE))
+
+    def _new_version(self):
+        base = datetime.now().strftime("%Y%m%dT%H%M%S")
+        version, n = base, 1
+        while os.path.exists(self.path(version)):
+            n += 1; version = f"{base}-{n}"
+        return version
+
+    def register(self, model, encoder, feature_names, metrics=None, params=None, compact=False, activate=True):
+        """Store a fitted model as a new version; returns the version id."""
+        version = self._new_version()
+        os.makedirs(self.path(version))
+        if not hasattr(model, "feature_names_in_"):
+            model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        joblib.dump(model, self.path(version, "model.joblib"))
+        if encoder is not None: joblib.dump(encoder, self.path(version, "label_encoder.joblib"))
+        classes = DiseaseModel(model, encoder).classes
+        meta = dict(version=version, created=datetime.now().isoformat(timespec="seconds"),
+                    estimator=type(model).__name__, feature_names=[str(c) for c in feature_names], classes=classes,
+                    metrics=metrics or {}, params=params or {}, compact=None)
+        with open(self.path(version, "meta.json"), "w") as f: json.dump(meta, f, indent=2)
+        if compact: self.compact(version)
+        if activate: self.activate(version)
+        return version
+
+    def import_pickle(self, model_path, encoder_path=None, activate=True):
+        model = joblib.load(model_path)
+        encoder = joblib.load(encoder_path) if encoder_path and os.path.exists(encoder_path) else None
+        names = [str(c) for c in getattr(model, "feature_names_in_", [])]
+        return self.register(model, encoder, names, params=dict(imported_from=os.path.abspath(model_path)),
+                             activate=activate)
+
+    def compact(self, version):
+        """Write the flattened form of a random-forest version next to its pickle."""
+        meta = self.meta(version)
+        model = joblib.load(self.path(version, "model.joblib"))
+        if not hasattr(model, "estimators_") or not hasattr(model.estimators_[0], "tree_"):
+            raise ValueError(f"{version} is a {meta['estimator']}; only tree forests can be compacted")
+        forest = CompactForest.from_forest(model, meta["classes"])
+        forest.save(self.path(version, COMPACT_DIR))
+        meta["compact"] = dict(depth=forest.depth, nodes=int(len(forest.left)),
+                               bytes=sum(getattr(forest, n).nbytes for n in COMPACT_ARRAYS))
+        with open(self.path(version, "meta.json"), "w") as f: json.dump(meta, f, indent=2)
+        return meta["compact"]
+
+    def load(self, version, prefer_compact=True) -> DiseaseModel:
+        meta = self.meta(version)
+        if prefer_compact and meta.get("compact"):
+            model = CompactForest.load(self.path(version, COMPACT_DIR), meta["classes"], meta["feature_names"],
+                                       meta["compact"]["depth"])
+            return DiseaseModel(model, None, version=version)
+        encoder_path = self.path(version, "label_encoder.joblib")
+        encoder = joblib.load(encoder_path) if os.path.exists(encoder_path) else None
+        return DiseaseModel(joblib.load(self.path(version, "model.joblib")), encoder, version=version)
+
+
+class LiveModel:
+    """The registry's active model (or a legacy pickle when nothing is active), loaded on first use."""
+
+    def __init__(self, registry, fallback=None, interval=5.0, prefer_compact=True):
+        self.registry = registry
+        self.fallback = fallback                # (model path, encoder path) for DiseaseModel.load
+        self.interval = interval
+        self.prefer_compact = prefer_compact
+        self.listeners = []                     # called with the new DiseaseModel after each swap
+        self._model = None
+        self._source = None                     # version id, or ("fallback", mtime_ns, size)
+        self._checked = None                    # monotonic time of the last ACTIVE check
+        self._lock = threading.Lock()
+        self.swaps = self.failures = 0
+
+    def _wanted(self):
+        version = self.registry.active_version()
+        if version or not self.fallback: return version
+        try: st = os.stat(self.fallback[0])
+        except OSError: return ("fallback", None, None)     # missing, or mid-rewrite: loading fails, current model stays
+        return ("fallback", st.st_mtime_ns, st.st_size)    # a retrained pickle is swapped in too
+
+    def get(self):
+        """Current DiseaseModel or None; checks ACTIVE at most every `interval` seconds."""
+        checked = self._checked
+        if checked is not None and time.monotonic() - checked < self.interval: return self._model
+        # Only one thread loads; the rest keep serving the current model meanwhile.
+        if not self._lock.acquire(blocking=checked is None): return self._model
+        try:
+            if self._checked is not None and time.monotonic() - self._checked < self.interval: return self._model
+            wanted = self._wanted()
+            if wanted != self._source:
+                try:
+                    fallback = isinstance(wanted, tuple)
+                    model = None if wanted is None else DiseaseModel.load(*self.fallback) if fallback \
+                        else self.registry.load(wanted, self.prefer_compact)
+                    if model is not None and fallback and read_meta(*self.fallback) is None:
+                        try: model.write_meta(*self.fallback)   # so the next start needn't unpickle for info()
+                        except OSError: pass
+                except Exception:
+                    model = None
+                if model is None and wanted is not None:
+                    self.failures += 1
+                else:
+                    self._model, self._source = model, wanted
+                    self.swaps += 1
+                    for fn in list(self.listeners):
+                        try: fn(model)
+                        except Exception: pass
+            self._checked = time.monotonic()
+        finally:
+            self._lock.release()
+        return self._model
+
+    def info(self):
+        """(feature names, classes) of the model that is or will be served, without loading it if possible."""
+        version = self.registry.active_version()
+        if self._model is None and version:
+            try:
+                meta = self.registry.meta(version)
+                return meta["feature_names"], meta["classes"]
+            except (OSError, ValueError, KeyError):
+                pass
+        if self._model is None and not version and self.fallback:
+            meta = read_meta(*self.fallback)
+            if meta: return meta
+        model = self.get()
+        return (model.feature_names, model.classes) if model else ([], [])
+
+    def stats(self) -> dict:
+        return dict(loaded=int(self._model is not None), swaps=self.swaps, failures=self.failures)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Manage versioned disease models")
+    p.add_argument("--registry", default=os.environ.get("MODEL_REGISTRY", os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "models")), help="Registry directory")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List versions; * marks the active one")
+    a = sub.add_parser("activate", help="Serve VERSION (running apps pick it up within MODEL_CHECK_INTERVAL)")
+    a.add_argument("version")
+    c = sub.add_parser("compact", help="Add the flattened forest format to VERSION")
+    c.add_argument("version")
+    i = sub.add_parser("import", help="Register an existing pickled model")
+    i.add_argument("model")
+    i.add_argument("--encoder", default=None, help="Pickled LabelEncoder to store with it")
+    i.add_argument("--compact", action="store_true", help="Also write the compact format")
+    i.add_argument("--no-activate", action="store_true", help="Register without serving it")
+    args = p.parse_args()
+
+    reg = ModelRegistry(args.registry)
+    if args.cmd == "list":
+        active = reg.active_version()
+        for m in reg.versions():
+            acc = m["metrics"].get("accuracy")
+            print(f"{'*' if m['version'] == active else ' '} {m['version']}  {m['estimator']:<24}"
+                  f"{len(m['feature_names']):>6} symptoms {len(m['classes']):>5} classes"
+                  f"  acc {'-' if acc is None else f'{acc:.4f}'}  {'compact' if m.get('compact') else ''}")
+    elif args.cmd == "activate":
+        reg.activate(args.version); print(f"Active: {args.version}")
+    elif args.cmd == "compact":
+        info = reg.compact(args.version)
+        print(f"Compacted {args.version}: {info['nodes']} nodes, depth {info['depth']}, {info['bytes'] / 2**20:.1f} MB")
+    elif args.cmd == "import":
+        version = reg.import_pickle(args.model, args.encoder, activate=False)
+        if args.compact: reg.compact(version)
+        if not args.no_activate: reg.activate(version)
+        print(f"Registered {args.model} as {version}{'' if args.no_activate else ' (active)'}")
@@ -0,0 +1,54 @@
+"""
+Bounded LRU cache for prediction results.
+
+Keys are built by the caller (canonical symptom set + data/model version);
+values are whatever the caller wants to reuse. Entries can optionally
+expire after `ttl` seconds, and `clear()` drops everything when the
+underlying dataset or model is swapped. Hit/miss/eviction counters are
+kept for scraping.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._data = OrderedDict()          # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        """Cached value for `key`, or None."""
+        if self.maxsize <= 0: return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1; return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]; self.expirations += 1; self.misses += 1
+                return None
+            self._data.move_to_end(key); self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0: return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False); self.evictions += 1
+
+    def clear(self, *_):
+        """Drop every entry; accepts and ignores listener arguments."""
+        with self._lock:
+            self._data.clear(); self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(size=len(self._data), maxsize=self.maxsize, ttl=self.ttl, hits=self.hits,
+                        misses=self.misses, evictions=self.evictions, expirations=self.expirations,
+                        invalidations=self.invalidations)
@@ -0,0 +1,131 @@
+"""
+Free-text symptom name resolution.
+
+A `SymptomResolver` is built once per column list (dataset snapshot or
+model) and maps user tokens to column names with the same precedence the
+old per-request `col_map` scan had:
+
+  1. exact match on the normalised name ("Body pain" -> "body_pain")
+  2. a known synonym of a column ("tired" -> "fatigue")
+  3. substring either way, earliest column wins
+  4. closest name within a small edit distance (typos)
+
+Step 3 goes through a trigram index and step 4 through a symmetric
+deletion index (two names within k edits share a string reachable by at
+most k deletions from each), so a lookup touches a handful of candidate
+columns instead of all of them.
+"""
+from bisect import bisect_left
+
+GRAM = 3
+MAX_EDITS = 2
+MAX_TOKEN = 64          # longer tokens skip the "column name inside token" substring pass
+
+SYNONYMS = {
+    "tired": "fatigue", "tiredness": "fatigue", "exhaustion": "fatigue",
+    "temperature": "fever", "high_temperature": "fever", "pyrexia": "fever",
+    "head_pain": "headache", "head_ache": "headache",
+    "throwing_up": "vomiting", "puking": "vomiting",
+    "feeling_sick": "nausea", "queasy": "nausea",
+    "body_ache": "body_pain", "body_aches": "body_pain", "aches": "body_pain",
+    "throat_pain": "sore_throat", "scratchy_throat": "sore_throat",
+    "stuffy_nose": "runny_nose", "blocked_nose": "congestion",
+    "short_of_breath": "breathlessness", "shortness_of_breath": "breathlessness",
+    "itchy": "itching", "itch": "itching",
+    "tummy_ache": "stomach_pain", "belly_pain": "stomach_pain",
+    "dizzy": "dizziness", "the_runs": "diarrhoea", "diarrhea": "diarrhoea",
+}
+
+
+def normalize(text) -> str:
+    return str(text).lower().strip().replace(" ", "_").replace("-", "_")
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def deletions(word: str, depth: int) -> set:
+    """`word` plus every string reachable by deleting up to `depth` characters."""
+    out = frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out = out | frontier
+    return out
+
+
+class SymptomResolver:
+    def __init__(self, columns, synonyms=None):
+        self.exact = {normalize(c): str(c) for c in columns}
+        self.keys = list(self.exact)                      # rank order for "earliest column wins"
+        self.rank = {k: i for i, k in enumerate(self.keys)}
+        syn = SYNONYMS if synonyms is None else synonyms
+        self.synonyms = {normalize(a): self.exact[normalize(t)] for a, t in syn.items()
+                         if normalize(t) in self.exact and normalize(a) not in self.exact}
+        self.grams = {}                                   # substring of length <= GRAM -> ranks containing it
+        for r, k in enumerate(self.keys):
+            for g in {k[i:i + n] for n in range(1, GRAM + 1) for i in range(len(k) - n + 1)}:
+                self.grams.setdefault(g, []).append(r)
+        self.lengths = sorted({len(k) for k in self.keys})
+        self.sorted_keys = sorted(self.keys)
+        self.deletes = {}                                 # key minus up to MAX_EDITS chars -> ranks
+        for r, k in enumerate(self.keys):
+            if len(k) > 2 and len(k) <= MAX_TOKEN:
+                for d in deletions(k, MAX_EDITS): self.deletes.setdefault(d, []).append(r)
+
+    def _containing(self, k):
+        """Ranks of keys that contain `k`, in rank order, via the rarest of its trigrams."""
+        if len(k) <= GRAM: return self.grams.get(k, [])
+        posts = [self.grams.get(k[i:i + GRAM]) for i in range(len(k) - GRAM + 1)]
+        if not all(posts): return []
+        return [r for r in min(posts, key=len) if k in self.keys[r]]
+
+    def _substring(self, k):
+        best = min(self._containing(k), default=None)
+        if len(k) <= MAX_TOKEN:
+            for n in self.lengths:
+                if n >= len(k): break
+                for i in range(len(k) - n + 1):
+                    r = self.rank.get(k[i:i + n])
+                    if r is not None and (best is None or r < best): best = r
+        return None if best is None else self.exact[self.keys[best]]
+
+    def _fuzzy(self, k):
+        if len(k) <= 2 or len(k) > MAX_TOKEN: return None
+        radius = 1 if len(k) <= 5 else MAX_EDITS
+        ranks = {r for d in deletions(k, radius) for r in self.deletes.get(d, ())}
+        hits = [(dist, r) for r in ranks for dist in [edit_distance(k, self.keys[r])] if dist <= radius]
+        return self.exact[self.keys[min(hits)[1]]] if hits else None
+
+    def lookup(self, token):
+        k = normalize(token)
+        if not k: return None
+        return self.exact.get(k) or self.synonyms.get(k) or self._substring(k) or self._fuzzy(k)
+
+    def resolve(self, tokens):
+        """(resolved column names, unresolved tokens)."""
+        req, unknown = [], []
+        for t in tokens:
+            m = self.lookup(t)
+            (req if m else unknown).append(m or t)
+        return req, unknown
+
+    def suggest(self, prefix, limit=8):
+        """Column names for autocomplete: prefix matches alphabetically, then other substring hits."""
+        k = normalize(prefix)
+        if not k: return []
+        out = []
+        i = bisect_left(self.sorted_keys, k)
+        while i < len(self.sorted_keys) and self.sorted_keys[i].startswith(k) and len(out) < limit:
+            out.append(self.sorted_keys[i]); i += 1
+        if len(out) < limit:
+            seen = set(out)
+            out += [key for key in (self.keys[r] for r in self._containing(k))
+                    if key not in seen][:limit - len(out)]
+        return [self.exact[key] for key in out]
@@ -0,0 +1,103 @@
+"""
+Precomputed disease/symptom statistics for one dataset snapshot.
+
+Built once per snapshot (by the store, before the snapshot goes live) so
+requests never scan rows for them:
+
+  counts    (diseases + 1, symptoms) rows of each disease that report each
+            symptom; the extra last row is the "sink" of missing/excluded labels
+  totals    rows per disease code (the priors), same sink convention
+  cooc      pairwise co-occurrence among the most reported symptoms, from an
+            evenly strided row sample so large datasets stay cheap to reload
+
+`rank()` is a Bernoulli naive-Bayes score over the present symptoms only,
+O(query x diseases), used when no row has every requested symptom.
+`related()` lists symptoms commonly reported alongside a query.
+"""
+import numpy as np
+
+COOC_SYMPTOMS = 1024        # most reported symptoms kept in the pairwise table
+COOC_ROWS = 50000           # rows sampled for the pairwise table
+BLOCK_CELLS = 1 << 22       # float32 cells (symptom block plus one-hot labels) per step
+ALPHA = 1.0                 # Laplace smoothing
+
+
+class SymptomStats:
+    def __init__(self, symptoms, diseases, valid, counts, totals, cooc_symptoms, cooc):
+        self.symptoms = list(symptoms)
+        self.index = {c: i for i, c in enumerate(self.symptoms)}
+        self.diseases = list(diseases)
+        self.counts = counts                # int64 (D + 1, S)
+        self.totals = totals                # int64 (D + 1,)
+        self.cooc_symptoms = cooc_symptoms  # symptom indices covered by `cooc`, most reported first
+        self.cooc = cooc                    # int32 (len(cooc_symptoms),) * 2; diagonal = symptom count
+        self.cooc_pos = np.full(len(self.symptoms), -1, dtype=np.intp)
+        self.cooc_pos[cooc_symptoms] = np.arange(len(cooc_symptoms))
+        D = len(self.diseases)
+        n = totals[:D]
+        self.rankable = np.asarray(valid, dtype=bool) & (n > 0)
+        k = max(int(self.rankable.sum()), 1)
+        self.log_prior = np.where(self.rankable, np.log((n + ALPHA) / (n[self.rankable].sum() + ALPHA * k)), -np.inf)
+        self.log_lik = np.log((counts[:D] + ALPHA) / (n[:, None] + 2 * ALPHA)).astype(np.float32)
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        S, D, rows = len(snap.symptoms), len(snap.diseases), snap.rows
+        counts = np.zeros((D + 1, S), dtype=np.int64)
+        step = max(1, BLOCK_CELLS // (S + D + 1))           # the one-hot block is (step, D + 1)
+        for at in range(0, rows, step):
+            block = np.asarray(snap.matrix[at:at + step], dtype=np.float32)
+            onehot = np.zeros((len(block), D + 1), dtype=np.float32)
+            onehot[np.arange(len(block)), snap.codes[at:at + step]] = 1
+            counts += (onehot.T @ block).astype(np.int64)    # exact: per-block sums stay far below 2**24
+        totals = np.bincount(snap.codes, minlength=D + 1).astype(np.int64)
+
+        reported = counts.sum(axis=0)
+        keep = np.argsort(-reported, kind="stable")[:COOC_SYMPTOMS]
+        sample = np.unique(np.linspace(0, rows - 1, min(rows, COOC_ROWS)).astype(np.intp)) if rows else \
+            np.zeros(0, np.intp)
+        cooc = np.zeros((len(keep), len(keep)), dtype=np.float32)
+        step = max(1, BLOCK_CELLS // max(len(keep), 1))
+        for at in range(0, len(sample), step):
+            block = np.asarray(snap.matrix[np.ix_(sample[at:at + step], keep)], dtype=np.float32)
+            cooc += block.T @ block
+        return cls(snap.symptoms, snap.diseases, snap.valid, counts, totals, keep, cooc.astype(np.int32))
+
+    def _positions(self, columns):
+        return [self.index[c] for c in dict.fromkeys(columns) if c in self.index]
+
+    def posterior(self, columns) -> np.ndarray:
+        """P(disease | present symptoms) over every disease code; zeros where not rankable."""
+        idx = self._positions(columns)
+        score = self.log_prior + self.log_lik[:, idx].sum(axis=1)
+        if not self.rankable.any(): return np.zeros(len(self.diseases))
+        score = np.exp(score - score[self.rankable].max())
+        return score / score.sum()
+
+    def rank(self, columns, top=20):
+        """[(disease, probability)] by naive-Bayes posterior, best first."""
+        if not self.rankable.any(): return []
+        post = self.posterior(columns)
+        order = np.argsort(-post, kind="stable")
+        return [(self.diseases[d], float(post[d])) for d in order[:top] if self.rankable[d]]
+
+    def related(self, columns, limit=8):
+        """Symptoms most often reported together with `columns`, excluding them.
+
+        Averages P(other | s) over the query symptoms covered by the pairwise table;
+        when none are covered, mixes the per-disease symptom rates by the posterior.
+        """
+        idx = self._positions(columns)
+        if not idx: return []
+        pos = [p for p in self.cooc_pos[idx] if p >= 0]
+        if pos:
+            rows = self.cooc[pos].astype(np.float64)
+            score = np.zeros(len(self.symptoms))
+            score[self.cooc_symptoms] = (rows / np.maximum(np.diag(self.cooc)[pos], 1)[:, None]).mean(axis=0)
+        else:
+            D = len(self.diseases)
+            rate = self.counts[:D] / np.maximum(self.totals[:D], 1)[:, None]
+            score = self.posterior(columns) @ rate
+        score[idx] = 0
+        order = np.argsort(-score, kind="stable")[:limit]
+        return [self.symptoms[i] for i in order if score[i] > 0]
@@ -1,81 +1,569 @@
+#!/usr/bin/env python3
+"""
+Train the disease classifier, save it to disease_model.pkl and register it as a
+new version in the model registry (see model_registry.py), which the running app
+picks up without a restart.
+
+Usage examples:
+  python3 train_model.py                                   # in-memory, TEST_MODE subset
+  python3 train_model.py --stream --learner nb             # out-of-core partial_fit over CSV chunks
+  python3 train_model.py --stream --learner forest --jobs 4  # full-data forest from the memory-mapped .symds
+  python3 train_model.py --stream --data data.symds        # train straight from a converted dataset
+  python3 train_model.py --stream --learner forest --compact --no-activate  # stage a compact version
+  python3 train_model.py --search random --n-iter 12 --folds 5 --workers 8 --worker-memory 2048 \
+      --target-accuracy 0.9                                # cross-validated search, keeps the fastest model
+"""
+import argparse
+import itertools
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import psutil  # For RAM monitoring
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import accuracy_score
-import joblib
-import psutil  # For RAM monitoring
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.naive_bayes import BernoulliNB
+from sklearn.preprocessing import LabelEncoder
 
-# Target column (adjust if wrong)
-TARGET = "prognosis" 
-# Test mode: Use a small subset to avoid RAM crashes
-TEST_MODE = True  
-SUBSET_SIZE = 2000  
+import binary_dataset
+from inference import DiseaseModel
+from model_registry import ModelRegistry
 
-print("Loading dataset...")
-data = None
 try:
-    # Load normally first to check dtypes
-    data = pd.read_csv("sample_dataset.csv")
-    print(f"Full dataset shape: {data.shape}")
-    print(f"Columns: {list(data.columns)}")
-    print(f"Target column '{TARGET}' exists: {TARGET in data.columns}")
-    print(f"Sample dtypes:\n{data.dtypes.head(10)}") 
-    
-    # Optimize dtypes for memory: Convert binary/numeric columns to int8, leave strings as is
-    dtype_dict = {}
-    for col in data.columns:
-        if col != TARGET and data[col].dtype == 'int64':  # Assume symptoms are int64; convert to int8
-            dtype_dict[col] = 'int8'
-    if dtype_dict:
-        data = pd.read_csv("data.csv", dtype=dtype_dict)  # Reload with optimized dtypes
-        print("Reloaded with optimized dtypes for memory.")
-    
-    print(f"RAM usage after load: {psutil.virtual_memory().percent}%")
-except FileNotFoundError:
-    print("Warning: 'data.csv' not found. Check the file path. Skipping training.")
-    # No exit() - continue without data
-except Exception as e:
-    print(f"Error loading data: {e}. Skipping training.")
-    # No exit() - continue
-
-if data is not None:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Target column (adjust if wrong); the app's datasets use "Disease"
+TARGET = "prognosis"
+TARGET_FALLBACKS = ("Disease", "disease")
+# Test mode: Use a small subset to avoid RAM crashes
+TEST_MODE = True
+SUBSET_SIZE = 2000
+CHUNK_ROWS = 20000
+HOLDOUT_EVERY = 5  # streaming mode: every 5th row is held out for evaluation (20%)
+
+# Default inputs and outputs sit next to this script, where app.py looks for them (MODEL_PATH as in the app).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get("MODEL_PATH", os.path.join(BASE_DIR, "disease_model.pkl"))
+ENCODER_PATH = os.path.join(os.path.dirname(MODEL_PATH), "label_encoder.pkl")
+
+_peak_rss = 0
+
+
+def report_ram(stage):
+    """Print system RAM usage plus this process's current and peak RSS."""
+    global _peak_rss
+    rss = psutil.Process().memory_info().rss
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    peak = max(_peak_rss, rss, maxrss * (1 if sys.platform == "darwin" else 1024))
+    _peak_rss = peak
+    print(f"RAM usage {stage}: {psutil.virtual_memory().percent}% "
+          f"(process RSS {rss / 2**20:.0f} MB, peak {peak / 2**20:.0f} MB)")
+
+
+def find_target(columns, target):
+    if target in columns: return target
+    return next((c for c in TARGET_FALLBACKS if c in columns), None)
+
+
+def save_model(model, le, features, model_path=MODEL_PATH, encoder_path=ENCODER_PATH,
+               metrics=None, params=None, registry=None, compact=False, activate=True):
+    # The app reads feature_names_in_; models fitted on plain arrays don't set it themselves.
+    if not hasattr(model, "feature_names_in_"):
+        model.feature_names_in_ = np.asarray(features, dtype=object)
+    joblib.dump(model, model_path)
+    if le is not None:
+        joblib.dump(le, encoder_path)
+    DiseaseModel(model, le).write_meta(model_path, encoder_path)   # lets the app start without unpickling it
+    print(f"Model saved to {model_path}.")
+    if registry:
+        if compact and not hasattr(model, "estimators_"):
+            print(f"Note: --compact only applies to forests; registering {type(model).__name__} as is.")
+            compact = False
+        version = ModelRegistry(registry).register(model, le, features, metrics, params, compact, activate)
+        print(f"Registered as {version} in {registry}{' (active)' if activate else ''}.")
+
+
+# ── In-memory mode (original behaviour) ──────────────────────────────────
+def train_in_memory(path, target, **save):
+    print("Loading dataset...")
+    data = None
+    try:
+        # Load normally first to check dtypes
+        data = pd.read_csv(path)
+        print(f"Full dataset shape: {data.shape}")
+        print(f"Columns: {list(data.columns)}")
+        target = find_target(data.columns, target) or target
+        print(f"Target column '{target}' exists: {target in data.columns}")
+        print(f"Sample dtypes:\n{data.dtypes.head(10)}")
+
+        # Optimize dtypes for memory: Convert binary/numeric columns to int8, leave strings as is
+        dtype_dict = {}
+        for col in data.columns:
+            if col != target and data[col].dtype == 'int64':  # Assume symptoms are int64; convert to int8
+                dtype_dict[col] = 'int8'
+        if dtype_dict:
+            data = pd.read_csv(path, dtype=dtype_dict)  # Reload with optimized dtypes
+            print("Reloaded with optimized dtypes for memory.")
+
+        report_ram("after load")
+    except FileNotFoundError:
+        print(f"Warning: '{path}' not found. Check the file path. Skipping training.")
+        # No exit() - continue without data
+    except Exception as e:
+        print(f"Error loading data: {e}. Skipping training.")
+        # No exit() - continue
+
+    if data is None:
+        print("No data loaded. Please fix file issues and rerun.")
+        return
+
     # Sample for testing (to prevent RAM crashes)
-    if TEST_MODE:
+    if TEST_MODE and len(data) > SUBSET_SIZE:
         data = data.sample(n=SUBSET_SIZE, random_state=42)
         print(f"Using subset shape: {data.shape}")
 
     # Prepare X and y
-    if TARGET not in data.columns:
-        print(f"Warning: Target column '{TARGET}' not found. Available: {list(data.columns)}. Skipping training.")
+    if target not in data.columns:
+        print(f"Warning: Target column '{target}' not found. Available: {list(data.columns)}. Skipping training.")
+        return
+    X = data.drop(target, axis=1)
+    y = data[target]
+
+    # If y is strings (e.g., disease names), encode to numbers
+    le = None
+    if y.dtype == 'object':  # Strings
+        le = LabelEncoder()
+        y = le.fit_transform(y)
+        print("Encoded target to integers.")
+
+    print("Splitting dataset...")
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y  # Stratify for imbalance
+    )
+
+    print("Training model...")
+    t0 = time.perf_counter()
+    model = RandomForestClassifier(n_estimators=100, random_state=42)  # Reduced from 200 for speed/RAM
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - t0
+    report_ram("after training")
+
+    print("Evaluating model...")
+    predictions = model.predict(X_test)
+    accuracy = accuracy_score(y_test, predictions)
+    print(f"Model Accuracy: {accuracy:.4f}")
+
+    # Save model (and the encoder, so the app can decode predicted labels)
+    save_model(model, le, list(X.columns),
+               metrics=dict(accuracy=float(accuracy), test_rows=len(y_test), fit_seconds=round(fit_seconds, 3)),
+               params=dict(data=os.path.abspath(path), learner="forest", n_estimators=100, rows=len(data)), **save)
+    report_ram("final")
+
+
+# ── Streaming / out-of-core mode ─────────────────────────────────────────
+def header_dtypes(path, target):
+    """Symptom columns and a fixed int8 dtype map taken from the header alone (no type inference)."""
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    target = find_target(columns, target)
+    if target is None:
+        raise SystemExit(f"No target column in {path}; looked for {TARGET!r} and {TARGET_FALLBACKS}.")
+    features = [c for c in columns if c != target]
+    return target, features, {**{c: np.int8 for c in features}, target: str}
+
+
+def iter_chunks(path, target, features, dtypes, chunksize=CHUNK_ROWS):
+    """Yield (int8 feature block, label array) per CSV chunk."""
+    for chunk in pd.read_csv(path, dtype=dtypes, chunksize=chunksize):
+        chunk = chunk.dropna(subset=[target])
+        yield chunk[features].to_numpy(dtype=np.int8), chunk[target].to_numpy(dtype=str)
+
+
+def scan_labels(path, target, chunksize=CHUNK_ROWS * 5):
+    """One cheap pass over the target column only: (row count, LabelEncoder over all classes)."""
+    rows, classes = 0, set()
+    for chunk in pd.read_csv(path, usecols=[target], dtype={target: str}, chunksize=chunksize):
+        labels = chunk[target].dropna()
+        rows += len(labels); classes.update(labels.unique())
+    le = LabelEncoder().fit(sorted(classes))
+    return rows, le
+
+
+def open_binary(path):
+    """Memory-mapped (X, y, LabelEncoder, features) from a .symds directory; unlabeled rows get y = -1."""
+    meta, X, labels, _ = binary_dataset.open_arrays(path)
+    le = LabelEncoder().fit(sorted(meta["diseases"]))
+    remap = np.append(le.transform(meta["diseases"]), -1).astype(np.int32)   # code -1 indexes the trailing -1
+    return X, remap[labels], le, meta["symptoms"]
+
+
+def make_incremental(learner):
+    if learner == "nb": return BernoulliNB(alpha=1.0)
+    return SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+
+
+def holdout_mask(start, y):
+    """Labeled rows of a block starting at global row `start` that are held out (every HOLDOUT_EVERY-th)."""
+    return ((np.arange(start, start + len(y)) % HOLDOUT_EVERY) == 0) & (y >= 0)
+
+
+def train_incremental(blocks, le, learner):
+    """partial_fit over (X, y-encoded, global row offset) blocks, skipping the held-out rows."""
+    model, classes = make_incremental(learner), np.arange(len(le.classes_))
+    for X, y, start in blocks:
+        train = ~holdout_mask(start, y) & (y >= 0)
+        model.partial_fit(X[train], y[train], classes=classes)
+        report_ram(f"after {start + len(X)} rows")
+    return model
+
+
+def score_holdout(model, blocks):
+    """(correct, total) over the held-out rows, predicted one block at a time in a second pass."""
+    correct = total = 0
+    for X, y, start in blocks:
+        test = holdout_mask(start, y)
+        if not test.any(): continue
+        correct += int((model.predict(X[test]) == y[test]).sum())
+        total += int(test.sum())
+    return correct, total
+
+
+def train_forest(X, y, jobs, n_estimators, max_samples):
+    """RandomForest over every training row without holding a float copy of them in RAM.
+
+    sklearn fits trees on float32, so the training rows are converted block by block into a
+    temporary float32 memmap; the forest then reads it through the page cache.
+    """
+    train_idx = np.flatnonzero(~holdout_mask(0, y) & (y >= 0))
+    model = RandomForestClassifier(n_estimators=n_estimators, n_jobs=jobs, random_state=42,
+                                   max_samples=max_samples)
+    with tempfile.TemporaryDirectory() as tmp:
+        Xf = np.lib.format.open_memmap(os.path.join(tmp, "X_train.f32.npy"), mode="w+", dtype=np.float32,
+                                       shape=(len(train_idx), X.shape[1]))
+        for at in range(0, len(train_idx), CHUNK_ROWS):
+            Xf[at:at + CHUNK_ROWS] = X[train_idx[at:at + CHUNK_ROWS]]
+        Xf.flush()
+        report_ram("after float32 conversion")
+        model.fit(Xf, y[train_idx])
+        del Xf
+    return model
+
+
+def binary_for(data, chunksize=CHUNK_ROWS):
+    """The .symds directory for `data`, converting a CSV (once, until it changes) when needed."""
+    if os.path.isdir(data): return data
+    binary = binary_dataset.sidecar_path(data)
+    if not binary_dataset.is_fresh(binary, data):
+        print(f"Converting {data} -> {binary} ...")
+        binary_dataset.convert(data, binary, chunksize)
+    return binary
+
+
+def train_streaming(args):
+    t0 = time.perf_counter()
+    binary = binary_for(args.data, args.chunksize) if os.path.isdir(args.data) or args.learner == "forest" \
+        or args.cache else None
+    if binary:
+        X, y, le, features = open_binary(binary)
+        print(f"Mapped {binary}: {X.shape[0]} rows x {len(features)} symptoms, learner '{args.learner}'")
+        report_ram("after mapping dataset")
+        def blocks():
+            return ((X[i:i + args.chunksize], y[i:i + args.chunksize], i) for i in range(0, len(y), args.chunksize))
+        if args.learner == "forest":
+            model = train_forest(X, y, args.jobs, args.n_estimators, args.max_samples)
+        else:
+            model = train_incremental(blocks(), le, args.learner)
     else:
-        X = data.drop(TARGET, axis=1)
-        y = data[TARGET]
-
-        # If y is strings (e.g., disease names), encode to numbers
-        from sklearn.preprocessing import LabelEncoder
-        if y.dtype == 'object':  # Strings
-            le = LabelEncoder()
-            y = le.fit_transform(y)
-            print("Encoded target to integers.")
-
-        print("Splitting dataset...")
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y  # Stratify for imbalance
-        )
-
-        print("Training model...")
-        model = RandomForestClassifier(n_estimators=100, random_state=42)  # Reduced from 200 for speed/RAM
-        model.fit(X_train, y_train)
-        print(f"RAM usage after training: {psutil.virtual_memory().percent}%")
-
-        print("Evaluating model...")
-        predictions = model.predict(X_test)
-        accuracy = accuracy_score(y_test, predictions)
-        print(f"Model Accuracy: {accuracy:.4f}")
-
-        # Save model
-        joblib.dump(model, "disease_model.pkl")
-        print("Model saved successfully.")
-        print(f"Final RAM usage: {psutil.virtual_memory().percent}%")
-else:
-    print("No data loaded. Please fix file issues and rerun.")
\ No newline at end of file
+        target, features, dtypes = header_dtypes(args.data, args.target)
+        print(f"Streaming {args.data}: {len(features)} symptoms, target '{target}', learner '{args.learner}'")
+        _, le = scan_labels(args.data, target)
+        def blocks():
+            start = 0
+            for xb, yb in iter_chunks(args.data, target, features, dtypes, args.chunksize):
+                yield xb, le.transform(yb), start
+                start += len(xb)
+        model = train_incremental(blocks(), le, args.learner)
+    report_ram("after training")
+
+    print("Evaluating model...")
+    correct, total = score_holdout(model, blocks())
+    accuracy = correct / total if total else float("nan")
+    print(f"Model Accuracy: {accuracy:.4f} on {total} held-out rows ({time.perf_counter() - t0:.1f}s)")
+    report_ram("after evaluation")
+    save_model(model, le, features,
+               metrics=dict(accuracy=accuracy if total else None, test_rows=total,
+                            fit_seconds=round(time.perf_counter() - t0, 3)),
+               params=dict(data=os.path.abspath(args.data), learner=args.learner, n_estimators=args.n_estimators,
+                           max_samples=args.max_samples),
+               registry=args.registry, compact=args.compact, activate=not args.no_activate)
+    report_ram("final")
+
+
+# ── Hyperparameter search ────────────────────────────────────────────────
+# Forest settings tried by --search; --param NAME=V1,V2 replaces a row.
+SEARCH_SPACE = {
+    "n_estimators": (100, 200, 400),        # upper bound: early stopping may keep fewer trees
+    "max_depth": (None, 16, 32),
+    "max_features": ("sqrt", "log2", 0.1),
+    "min_samples_leaf": (1, 3),
+}
+EARLY_STOP_STEP = 25        # trees added between validation checks
+EARLY_STOP_PATIENCE = 2     # checks without improvement before a fold stops growing
+EARLY_STOP_TOL = 1e-3       # accuracy gain that counts as an improvement
+
+_search = {}                # per-worker state, set by _init_search
+
+
+def parse_param(spec):
+    """'max_depth=None,16' -> ('max_depth', [None, 16])."""
+    name, _, values = spec.partition("=")
+    if name not in SEARCH_SPACE or not values:
+        raise SystemExit(f"--param expects NAME=V1,V2 with NAME in {sorted(SEARCH_SPACE)}, got {spec!r}")
+    def value(v):
+        if v == "None": return None
+        for cast in (int, float):
+            try: return cast(v)
+            except ValueError: pass
+        return v
+    return name, [value(v) for v in values.split(",")]
+
+
+def candidates(space, search, n_iter, seed):
+    """Every combination for a grid search, or `n_iter` distinct ones drawn at random."""
+    grid = [dict(zip(space, combo)) for combo in itertools.product(*space.values())]
+    if search == "random" and n_iter < len(grid):
+        pick = np.random.default_rng(seed).choice(len(grid), n_iter, replace=False)
+        grid = [grid[i] for i in sorted(pick)]
+    return grid
+
+
+def write_folds(X, y, folds, seed, out):
+    """Write the labelled rows as one float32 memmap ordered by validation fold, wrapped around.
+
+    Returns (path, labels in fold order, fold bounds). The file holds folds 0..K-1 followed by
+    folds 0..K-2 again, so fold k's validation rows are the slice bounds[k]:bounds[k + 1] and
+    its training rows (every other fold) the contiguous slice of n - len(fold k) rows right
+    after it. Workers train and validate on views: they map the same pages, none copies the matrix.
+    """
+    rows = np.flatnonzero(y >= 0)
+    tests = [test for _, test in StratifiedKFold(folds, shuffle=True, random_state=seed)
+             .split(np.zeros(len(rows)), y[rows])]
+    order = rows[np.concatenate(tests)]
+    bounds = np.cumsum([0] + [len(t) for t in tests])
+    layout = np.concatenate([order, order[:bounds[-2]]])
+    path = os.path.join(out, "X.f32.npy")
+    Xf = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(layout), X.shape[1]))
+    for at in range(0, len(layout), CHUNK_ROWS):
+        Xf[at:at + CHUNK_ROWS] = X[layout[at:at + CHUNK_ROWS]]
+    Xf.flush()
+    del Xf
+    np.save(os.path.join(out, "y.npy"), y[layout])
+    return path, y[order], bounds
+
+
+def _init_search(cfg):
+    _search.update(cfg)
+    _search["X"] = np.load(cfg["x_path"], mmap_mode="r")
+    _search["y"] = np.load(cfg["y_path"])
+    if cfg["memory_mb"] and resource is not None:
+        # RLIMIT_AS caps address space, so the budget goes on top of what is mapped already
+        # (the shared matrix included); a fold that needs more fails with MemoryError.
+        limit = psutil.Process().memory_info().vms + cfg["memory_mb"] * 2**20
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+
+
+class _ByteCount:
+    """File-like sink that only counts what is written to it."""
+    def __init__(self): self.n = 0
+    def write(self, b): self.n += memoryview(b).nbytes
+
+
+def _cv_fold(task):
+    """Fit one candidate on every fold but `fold`, adding trees until validation accuracy stops improving."""
+    cand, params, fold, step = task
+    X, y, (a, b) = _search["X"], _search["y"], _search["bounds"][fold:fold + 2]
+    train = slice(b, b + _search["bounds"][-1] - (b - a))     # the other folds (see write_folds)
+    cap = params["n_estimators"]
+    sizes = (list(range(step, cap, step)) if step else []) + [cap]
+    model = RandomForestClassifier(**params, warm_start=True, n_jobs=1, random_state=_search["seed"])
+    votes, tree_seconds, fit_seconds = 0, [], 0.0
+    best = dict(accuracy=-1.0)
+    stale = 0
+    try:
+        for trees in sizes:
+            t = time.perf_counter()
+            model.set_params(n_estimators=trees).fit(X[train], y[train])
+            fit_seconds += time.perf_counter() - t
+            for est in model.estimators_[len(tree_seconds):]:   # score only the new trees
+                t = time.perf_counter()
+                votes = votes + np.concatenate([est.predict_proba(X[i:min(i + CHUNK_ROWS, b)])
+                                                for i in range(a, b, CHUNK_ROWS)])
+                tree_seconds.append(time.perf_counter() - t)
+            pred = model.classes_[np.argmax(votes, axis=1)]
+            accuracy = float((pred == y[a:b]).mean())
+            if accuracy > best["accuracy"] + EARLY_STOP_TOL:
+                best, stale = dict(accuracy=accuracy, trees=trees, fit_seconds=fit_seconds, pred=pred), 0
+            else:
+                stale += 1
+                if stale >= EARLY_STOP_PATIENCE: break
+        model.estimators_ = model.estimators_[:best["trees"]]
+        model.n_estimators = best["trees"]
+        size = _ByteCount()
+        pickle.dump(model, size, protocol=pickle.HIGHEST_PROTOCOL)
+    except MemoryError:
+        return dict(cand=cand, fold=fold, error="MemoryError (raise --worker-memory)")
+    k = _search["n_classes"]
+    confusion = np.bincount(y[a:b].astype(np.int64) * k + best.pop("pred"), minlength=k * k).reshape(k, k)
+    return dict(cand=cand, fold=fold, **best, predict_us=sum(tree_seconds[:best["trees"]]) / max(b - a, 1) * 1e6,
+                nodes=sum(e.tree_.node_count for e in model.estimators_), model_bytes=size.n, confusion=confusion)
+
+
+def summarize(cands, results, classes, folds):
+    """Per-candidate means over folds plus per-class precision/recall/F1 from the pooled confusion matrix."""
+    out = []
+    for i, params in enumerate(cands):
+        rs = [r for r in results if r["cand"] == i]
+        errors = [r["error"] for r in rs if "error" in r]
+        if errors or len(rs) < folds:
+            out.append(dict(params=params, error=errors[0] if errors else "incomplete")); continue
+        conf = sum(r["confusion"] for r in rs)
+        tp, support, predicted = np.diag(conf).astype(float), conf.sum(axis=1), conf.sum(axis=0)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=precision + recall > 0)
+        acc = [r["accuracy"] for r in sorted(rs, key=lambda r: r["fold"])]
+        mean = lambda key: float(np.mean([r[key] for r in rs]))
+        out.append(dict(params=params, accuracy=float(np.mean(acc)), accuracy_std=float(np.std(acc)), fold_accuracy=acc,
+                        trees=int(np.ceil(mean("trees"))), fit_seconds=round(mean("fit_seconds"), 3),
+                        predict_us_per_row=round(mean("predict_us"), 2), nodes=int(mean("nodes")),
+                        model_bytes=int(mean("model_bytes")), macro_f1=float(f1[support > 0].mean()),
+                        per_class={str(c): dict(precision=round(float(precision[j]), 4), recall=round(float(recall[j]), 4),
+                                                f1=round(float(f1[j]), 4), support=int(support[j]))
+                                   for j, c in enumerate(classes) if support[j]}))
+    return out
+
+
+def select(summary, target):
+    """(index, reason): the fastest-predicting candidate meeting `target`, else the most accurate."""
+    ok = [i for i, c in enumerate(summary) if "error" not in c]
+    if not ok: return None, "every candidate failed"
+    meeting = [i for i in ok if target is not None and summary[i]["accuracy"] >= target]
+    if meeting:
+        i = min(meeting, key=lambda i: (summary[i]["predict_us_per_row"], summary[i]["fit_seconds"]))
+        return i, f"fastest to predict of {len(meeting)} candidate(s) with accuracy >= {target}"
+    return max(ok, key=lambda i: summary[i]["accuracy"]), \
+        "most accurate" + (f" (none reached {target})" if target is not None else "")
+
+
+def search(args):
+    t0 = time.perf_counter()
+    space = {**SEARCH_SPACE, **dict(parse_param(spec) for spec in args.param)}
+    cands = candidates(space, args.search, args.n_iter, args.seed)
+    X, y, le, features = open_binary(binary_for(args.data, args.chunksize))
+    tasks = [(i, c, k, args.early_stop_step) for i, c in enumerate(cands) for k in range(args.folds)]
+    workers = min(args.workers or os.cpu_count() or 1, len(tasks))
+    print(f"{args.search.capitalize()} search: {len(cands)} candidates x {args.folds} folds on "
+          f"{int((y >= 0).sum())} rows x {len(features)} symptoms, {workers} workers")
+    with tempfile.TemporaryDirectory() as tmp:
+        x_path, ys, bounds = write_folds(X, y, args.folds, args.seed, tmp)
+        report_ram("after writing the shared matrix")
+        cfg = dict(x_path=x_path, y_path=os.path.join(tmp, "y.npy"), bounds=bounds, seed=args.seed,
+                   n_classes=len(le.classes_), memory_mb=args.worker_memory)
+        results = []
+        with ProcessPoolExecutor(workers, initializer=_init_search, initargs=(cfg,)) as ex:
+            futures = {ex.submit(_cv_fold, t): t for t in tasks}
+            for done, fut in enumerate(as_completed(futures), 1):
+                cand, _, fold, _ = futures[fut]
+                try: r = fut.result()
+                except Exception as e:      # a worker killed outright breaks the pool: record and carry on
+                    r = dict(cand=cand, fold=fold, error=f"{type(e).__name__}: {e}")
+                results.append(r)
+                print(f"  [{done}/{len(tasks)}] candidate {cand} fold {fold}: " +
+                      (r["error"] if "error" in r else f"accuracy {r['accuracy']:.4f} with {r['trees']} trees"))
+
+        summary = summarize(cands, results, le.classes_, args.folds)
+        best, reason = select(summary, args.target_accuracy)
+        report = dict(data=os.path.abspath(args.data), rows=len(ys), symptoms=len(features), classes=len(le.classes_),
+                      search=args.search, folds=args.folds, seed=args.seed, space=space,
+                      early_stop_step=args.early_stop_step, worker_memory_mb=args.worker_memory,
+                      target_accuracy=args.target_accuracy, seconds=round(time.perf_counter() - t0, 1),
+                      selected=best, reason=reason, candidates=summary)
+        with open(args.report, "w") as f: json.dump(report, f, indent=2)
+
+        print(f"\n{'#':>3}  {'accuracy':<12} {'trees':>6} {'fit s':>8} {'us/row':>8} {'MB':>8}  params")
+        for i, c in enumerate(summary):
+            if "error" in c: print(f"{i:>3}  {'failed':<12} {c['params']}  {c['error']}"); continue
+            print(f"{i:>3}{'*' if i == best else ' '} {c['accuracy']:.4f}±{c['accuracy_std']:.3f} {c['trees']:>6} "
+                  f"{c['fit_seconds']:>8.2f} {c['predict_us_per_row']:>8.1f} {c['model_bytes'] / 2**20:>8.1f}  "
+                  f"{ {k: v for k, v in c['params'].items() if k != 'n_estimators'} }")
+        print(f"Report written to {args.report}")
+        if best is None: raise SystemExit("No candidate finished; nothing to save.")
+        chosen = summary[best]
+        params = {**chosen["params"], "n_estimators": chosen["trees"]}
+        print(f"Selected candidate {best}, {reason}; refitting {params} on all {len(ys)} rows...")
+        Xf = np.load(x_path, mmap_mode="r")
+        model = RandomForestClassifier(**params, n_jobs=args.jobs, random_state=args.seed)
+        t = time.perf_counter()
+        model.fit(Xf[:len(ys)], ys)                            # each row once, without the wrapped tail
+        fit_seconds = time.perf_counter() - t
+        del Xf
+    report_ram("after refit")
+    save_model(model, le, features,
+               metrics=dict(accuracy=chosen["accuracy"], accuracy_std=chosen["accuracy_std"],
+                            macro_f1=chosen["macro_f1"], cv_folds=args.folds, fit_seconds=round(fit_seconds, 3),
+                            predict_us_per_row=chosen["predict_us_per_row"]),
+               params=dict(params, data=os.path.abspath(args.data), search=args.search,
+                           report=os.path.abspath(args.report)),
+               registry=args.registry, compact=args.compact, activate=not args.no_activate)
+    report_ram("final")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Train the disease classifier")
+    p.add_argument("--data", default=os.path.join(BASE_DIR, "sample_dataset.csv"), help="Training CSV or .symds directory")
+    p.add_argument("--target", default=TARGET, help="Label column (falls back to Disease/disease)")
+    p.add_argument("--stream", action="store_true", help="Train on the full CSV out-of-core instead of a subset")
+    p.add_argument("--learner", choices=("nb", "sgd", "forest"), default="nb",
+                   help="Streaming learner: BernoulliNB / SGD via partial_fit, or RandomForest on the mmap cache")
+    p.add_argument("--cache", action="store_true",
+                   help="Convert the CSV once to a .symds sidecar (see binary_dataset.py) and train from it")
+    p.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="Rows per streamed chunk")
+    p.add_argument("--jobs", "-j", type=int, default=-1, help="Forest: parallel jobs")
+    p.add_argument("--n-estimators", type=int, default=100, help="Forest: number of trees")
+    p.add_argument("--max-samples", type=float, default=None, help="Forest: bootstrap fraction per tree")
+    p.add_argument("--registry", default=os.environ.get("MODEL_REGISTRY", os.path.join(BASE_DIR, "models")),
+                   help="Model registry directory to add the new version to ('' to skip)")
+    p.add_argument("--compact", action="store_true", help="Also store the forest in the compact inference format")
+    p.add_argument("--no-activate", action="store_true", help="Register the version without making it active")
+    s = p.add_argument_group("hyperparameter search (forest on the .symds matrix)")
+    s.add_argument("--search", choices=("grid", "random"), help="Cross-validated search instead of a single fit")
+    s.add_argument("--folds", type=int, default=5, help="Stratified folds")
+    s.add_argument("--n-iter", type=int, default=10, help="Random search: candidates drawn from the grid")
+    s.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                   help=f"Replace one row of the search space ({', '.join(SEARCH_SPACE)})")
+    s.add_argument("--workers", type=int, default=0, help="Worker processes, one fold fit each (0 = one per CPU)")
+    s.add_argument("--worker-memory", type=int, default=0, metavar="MB",
+                   help="Address-space budget per worker beyond the shared matrix (0 = unlimited)")
+    s.add_argument("--early-stop-step", type=int, default=EARLY_STOP_STEP,
+                   help="Trees added between validation checks (0 = always grow n_estimators)")
+    s.add_argument("--target-accuracy", type=float, default=None,
+                   help="Keep the fastest-predicting candidate with at least this CV accuracy")
+    s.add_argument("--report", default="search_report.json", help="Where to write the JSON report")
+    s.add_argument("--seed", type=int, default=42, help="Fold split, random search and forest seed")
+    args = p.parse_args()
+
+    if args.search: search(args)
+    elif args.stream: train_streaming(args)
+    else: train_in_memory(args.data, args.target, registry=args.registry, compact=args.compact,
+                          activate=not args.no_activate)
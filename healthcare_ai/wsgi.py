@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers.
+
+  flask --app app init-db                 # once, before the first start
+  gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module loads the dataset and the served model (registry
+versions otherwise load lazily on first use, as they do for a plain
+`import app`) but starts no threads and touches no database, so a pre-fork
+server can import it once in the master and every worker shares those pages
+copy-on-write.
+"""
+from app import app, models, start_background  # noqa: F401
+
+models.get()